@@ -3,7 +3,7 @@ from .rc import rc
 
 # --- nengo_extras namespace (API)
 from .convnet import Conv2d, Pool2d
-from .neurons import FastLIF, SoftLIFRate
+from .neurons import FastLIF, IntegerLIF, SoftLIFRate
 from . import data, dists, graphviz, gui, networks, neurons, probe, vision
 
 __copyright__ = "2015-2018, Applied Brain Research"
@@ -1,13 +1,31 @@
+import sys
+
 from nengo.utils.compat import pickle, PY2
 
 
 if PY2:
     from cStringIO import StringIO
     from urllib import urlretrieve
-    import Tkinter as tkinter
+    import Queue as queue
 else:
     from io import StringIO
     from urllib.request import urlretrieve
+    import queue
+
+
+def __getattr__(name):
+    # ``tkinter`` is imported on first access, so that importing
+    # ``nengo_extras`` does not load it
+    if name == 'tkinter':
+        import tkinter as tk
+        return tk
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+# no module __getattr__, so import ``tkinter`` now
+if PY2:
+    import Tkinter as tkinter
+elif sys.version_info < (3, 7):
     import tkinter
 
 
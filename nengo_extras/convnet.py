@@ -11,6 +11,65 @@ def softmax(x, axis=None):
     return ex / ex.sum(axis=axis, keepdims=True)
 
 
+def quantize_int8(weights):
+    """Symmetric int8 quantization with one scale per filter.
+
+    Each filter (i.e. each index along the first axis of ``weights``) is
+    scaled so that its largest magnitude maps to 127.
+
+    Returns
+    -------
+    quantized : ndarray (int8)
+        Quantized weights, with the same shape as ``weights``.
+    scales : ndarray (len(weights),)
+        Scale of each filter, such that ``weights`` is approximately
+        ``scales[:, None, ...] * quantized``.
+    """
+    weights = np.asarray(weights)
+    amax = np.abs(weights.reshape(len(weights), -1)).max(axis=1)
+    scales = np.where(amax > 0, amax / 127., 1.)
+    shape = (-1,) + (1,) * (weights.ndim - 1)
+    quantized = np.round(weights / scales.reshape(shape)).astype(np.int8)
+    return quantized, scales
+
+
+def quantized_buffer(weights, max_size=2**16):
+    """Float32 buffer for converting quantized ``weights`` in blocks.
+
+    The buffer holds at least one filter (i.e. ``weights[0]``), and otherwise
+    at most ``max_size`` elements.
+    """
+    size = min(weights.size, max(max_size, weights[0].size))
+    return np.empty(size, dtype=np.float32)
+
+
+def quantized_dot(x, weights, buffer=None):
+    """Compute ``np.dot(x, weights.reshape(len(weights), -1).T)``.
+
+    Calling ``np.dot`` directly on quantized ``weights`` would convert all of
+    them to a temporary float64 array. Instead, blocks of rows (filters) are
+    converted into ``buffer`` (see `.quantized_buffer`), and the products are
+    computed in float32. ``weights`` need not be contiguous.
+    """
+    buffer = quantized_buffer(weights) if buffer is None else buffer
+    rows = buffer.size // weights[0].size
+    assert rows >= 1, "Buffer must hold at least one row"
+
+    x = np.asarray(x, dtype=buffer.dtype)
+    y = np.empty(x.shape[:-1] + (len(weights),), dtype=buffer.dtype)
+    for i in range(0, len(weights), rows):
+        w = _dequantize_into(weights[i:i+rows], buffer)
+        y[..., i:i+rows] = np.dot(x, w.reshape(len(w), -1).T)
+    return y
+
+
+def _dequantize_into(weights, buffer):
+    """Copy ``weights`` into the start of the flat ``buffer``."""
+    out = buffer[:weights.size].reshape(weights.shape)
+    out[...] = weights
+    return out
+
+
 class Conv2d(Process):
     """Perform 2-D (image) convolution on an input.
 
@@ -34,6 +93,13 @@ class Conv2d(Process):
         Amount of zero-padding around the outside of the input image. Padding
         is applied to both sides, e.g. ``padding=(1, 0)`` will add one pixel
         of padding to the top and bottom, and none to the left and right.
+    scales : array_like (n_filters,), optional
+        Scale of each filter, for quantized (e.g. int8) ``filters`` (see
+        `.quantize_int8`). The outputs of each filter are multiplied by its
+        scale before adding the biases. Integer filters are converted to
+        float32 in blocks as they are used at each output position (see
+        `.quantized_dot`), so no float copy of them is kept. This makes
+        them slower than float filters.
     """
 
     shape_in = ShapeParam('shape_in', length=3, low=1)
@@ -43,9 +109,11 @@ class Conv2d(Process):
     filters = NdarrayParam('filters', shape=('...',))
     biases = NdarrayParam('biases', shape=('...',), optional=True)
     border = EnumParam('border', values=('floor', 'ceil'))
+    scales = NdarrayParam('scales', shape=('...',), optional=True)
 
-    def __init__(self, shape_in, filters, biases=None, strides=1, padding=0,
-                 border='ceil'):  # noqa: C901
+    def __init__(  # noqa: C901
+            self, shape_in, filters, biases=None, strides=1, padding=0,
+            border='ceil', scales=None):
         self.shape_in = shape_in
         self.filters = filters
         if self.filters.ndim not in [4, 6]:
@@ -77,6 +145,11 @@ class Conv2d(Process):
             raise ValueError("Number of local filters %r must match out shape "
                              "%r" % (self.filters.shape[1:3], (nyi, nyj)))
 
+        self.scales = scales
+        if self.scales is not None and self.scales.shape != (nf,):
+            raise ValueError("Scales shape %s must be (n_filters,) = %s"
+                             % (self.scales.shape, (nf,)))
+
         self.biases = biases if biases is not None else None
         if self.biases is not None:
             if self.biases.size == 1:
@@ -105,6 +178,12 @@ class Conv2d(Process):
         local_filters = filters.ndim == 6
         biases = self.biases
 
+        quantized = not np.issubdtype(filters.dtype, np.floating)
+        buffer = (quantized_buffer(filters[:, 0, 0] if local_filters else
+                                   filters) if quantized else None)
+        scales = (None if self.scales is None else
+                  self.scales.reshape(-1, 1, 1))
+
         nc, nxi, nxj = shape_in
         nf, nyi, nyj = shape_out
         si, sj = filters.shape[-2:]
@@ -127,9 +206,15 @@ class Conv2d(Process):
                          filters[:, :, sli, slj])
                     xij = x[:, :, max(i0, 0):min(i1, nxi),
                             max(j0, 0):min(j1, nxj)]
-                    y[:, :, i, j] = np.dot(
-                        xij.reshape(n, -1), w.reshape(nf, -1).T)
+                    if quantized:
+                        y[:, :, i, j] = quantized_dot(
+                            xij.reshape(n, -1), w, buffer=buffer)
+                    else:
+                        y[:, :, i, j] = np.dot(
+                            xij.reshape(n, -1), w.reshape(nf, -1).T)
 
+            if scales is not None:
+                y *= scales
             if biases is not None:
                 y += biases
 
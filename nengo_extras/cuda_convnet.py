@@ -7,7 +7,7 @@ import nengo
 import numpy as np
 
 from .compat import cmp, pickle_load
-from .deepnetworks import SequentialNetwork
+from .deepnetworks import NeuronLayer, SequentialNetwork, layer_synapse
 
 
 def load_model_pickle(loadfile):
@@ -59,6 +59,12 @@ def sort_layers(layers, depths=None, cycle_check=True):
 
 
 class CudaConvnetNetwork(SequentialNetwork):
+    """Nengo network built from a cuda-convnet model.
+
+    ``synapse`` can be a single synapse for all neuron layers, or give a
+    synapse for each layer by name or depth (see `.layer_synapse`).
+    """
+
     def __init__(self, model, synapse=None, lif_type='lif', **kwargs):
         super(CudaConvnetNetwork, self).__init__(**kwargs)
 
@@ -100,6 +106,10 @@ class CudaConvnetNetwork(SequentialNetwork):
         assert len(layer.get('inputs', [])) == 1
         return self._get_inputs(layer)[0]
 
+    def _neuron_synapse(self, name):
+        depth = sum(isinstance(layer, NeuronLayer) for layer in self.layers)
+        return layer_synapse(self.synapse, name, depth)
+
     def _add_data_layer(self, layer):
         d = layer['outputs']
         return self.add_data_layer(d, name=layer['name'])
@@ -140,8 +150,9 @@ class CudaConvnetNetwork(SequentialNetwork):
             raise NotImplementedError("Neuron type %r" % ntype)
 
         return self.add_neuron_layer(
-            n, inputs=inputs, neuron_type=neuron_type, synapse=self.synapse,
-            gain=gain, bias=bias, amplitude=amplitude, name=layer['name'])
+            n, inputs=inputs, neuron_type=neuron_type,
+            synapse=self._neuron_synapse(layer['name']), gain=gain, bias=bias,
+            amplitude=amplitude, name=layer['name'])
 
     def _add_softmax_layer(self, layer):
         return None  # non-neural, we can do without it
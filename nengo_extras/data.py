@@ -1,24 +1,153 @@
+import collections
+import contextlib
 import gzip
+import hashlib
 import io
 import os
 import re
+import shutil
 import tarfile
+import tempfile
+import threading
+import timeit
+import weakref
 
 import nengo
-from nengo.utils.compat import is_integer, is_iterable
+from nengo.params import IntParam, NdarrayParam, NumberParam, Parameter
+from nengo.utils.compat import is_integer, is_iterable, pickle
 import numpy as np
 
-from .compat import pickle_load_bytes, urlretrieve
+from .compat import pickle_load_bytes, queue, urlretrieve
 
 
 data_dir = nengo.rc.get('nengo_extras', 'data_dir')
 
+_active_load_stats = []
+
+
+class LoadStats(object):
+    """Wall time and bytes processed by each stage of loading datasets.
+
+    Collected by `.load_stats`. The stages are:
+
+    ``download``
+        Retrieving a dataset file.
+    ``hash``
+        Hashing a dataset file to find its cache entry.
+    ``gunzip``
+        Decompressing a dataset file (including members that are skipped).
+    ``unpickle``
+        Unpickling decompressed data.
+    ``concatenate``
+        Joining batches into single arrays.
+    ``decode``
+        Decoding JPEG images.
+    ``cache_save``, ``cache_load``
+        Writing and reading the uncompressed cache.
+
+    Attributes
+    ----------
+    stages : OrderedDict
+        Maps each stage name to a ``(calls, seconds, nbytes)`` tuple.
+    wall_time : float
+        Total time spent in the `.load_stats` block.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = collections.OrderedDict()
+        self.wall_time = 0.
+
+    def add(self, stage, seconds, nbytes=0):
+        calls, total_seconds, total_nbytes = self.stages.get(stage, (0, 0, 0))
+        self.stages[stage] = (
+            calls + 1, total_seconds + seconds, total_nbytes + nbytes)
+        if self.callback is not None:
+            self.callback(stage, seconds, nbytes)
+
+    def __str__(self):
+        lines = ["%-12s %6s %10s %12s %10s" % (
+            'stage', 'calls', 'time (s)', 'bytes', 'MB/s')]
+        for stage, (calls, seconds, nbytes) in self.stages.items():
+            rate = nbytes / seconds / 1e6 if seconds > 0 and nbytes else 0
+            lines.append("%-12s %6d %10.3f %12d %10.1f" % (
+                stage, calls, seconds, nbytes, rate))
+        lines.append("%-12s %6s %10.3f" % ('total', '', self.wall_time))
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def load_stats(callback=None):
+    """Collect timing statistics from the dataset loaders in this module.
+
+    Parameters
+    ----------
+    callback : callable (optional)
+        Called as ``callback(stage, seconds, nbytes)`` each time a stage
+        finishes (see `.LoadStats` for the stages).
+
+    Yields
+    ------
+    stats : `.LoadStats`
+        The statistics, which are complete once the block exits.
+
+    Examples
+    --------
+    >>> with load_stats() as stats:
+    ...     load_cifar10()
+    >>> print(stats)
+    """
+    stats = LoadStats(callback=callback)
+    _active_load_stats.append(stats)
+    t0 = timeit.default_timer()
+    try:
+        yield stats
+    finally:
+        stats.wall_time += timeit.default_timer() - t0
+        _active_load_stats.remove(stats)
+
+
+@contextlib.contextmanager
+def _stage(name, nbytes=0):
+    """Time a loading stage, if `.load_stats` is collecting.
+
+    Yields a dictionary in which ``'nbytes'`` can be set by the timed code.
+    """
+    info = {'nbytes': nbytes}
+    if len(_active_load_stats) == 0:
+        yield info
+        return
+
+    t0 = timeit.default_timer()
+    yield info
+    seconds = timeit.default_timer() - t0
+    for stats in _active_load_stats:
+        stats.add(name, seconds, info['nbytes'])
+
+
+def _concatenate(batches):
+    """Join a list of ``(X, Y)`` batches into single arrays"""
+    with _stage('concatenate') as info:
+        X = np.vstack([X for X, _ in batches])
+        Y = np.hstack([Y for _, Y in batches])
+        info['nbytes'] = X.nbytes + Y.nbytes
+    return X, Y
+
+
+def _unpickle(f):
+    with _stage('unpickle') as info:
+        obj = pickle_load_bytes(f)
+        info['nbytes'] = f.tell()
+    return obj
+
 
 def get_file(filename, url):
     filename = os.path.expanduser(filename)
     if not os.path.exists(filename):
         print("Retrieving %r" % url)
-        urlretrieve(url, filename=filename)
+        with _stage('download') as info:
+            urlretrieve(url, filename=filename)
+            info['nbytes'] = os.path.getsize(filename)
         print("Data retrieved as %r" % filename)
     return filename
 
@@ -58,7 +187,492 @@ def unpickle_tarfile(tar, name):
     return pickle_load_bytes(tarextract)
 
 
-def load_cifar10(filepath=None, n_train=5, n_test=1, label_names=False):
+def _next_member(members, select, remaining):
+    for member in members:
+        if not member.isfile():
+            continue
+        elif remaining is None:
+            if select(member.name):
+                return member
+        elif member.name in remaining:
+            remaining.remove(member.name)
+            return member
+    return None
+
+
+def iter_tarfile(filepath, select):
+    """Iterate over members of a gzipped tar archive in a single pass.
+
+    Members are visited in archive order while the archive is decompressed
+    sequentially. Opening members by name instead requires scanning the
+    whole archive for its member list, and rewinding the compressed stream
+    for each member.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the ``.tar.gz`` archive.
+    select : collection of str or callable
+        Names of the members to visit, or a function taking a member name
+        and returning whether to visit it. For a collection of names, reading
+        stops once all members have been found, and a ``KeyError`` is raised
+        if any are missing from the archive.
+
+    Yields
+    ------
+    name : str
+        The name of the member.
+    fileobj : file-like
+        The decompressed contents of the member. It must be read before
+        advancing the iterator, since the archive is read as a stream.
+    """
+    remaining = None if callable(select) else set(select)
+    if remaining is not None and len(remaining) == 0:
+        return
+
+    with tarfile.open(filepath, 'r|gz') as tar:
+        members = iter(tar)
+        while remaining is None or len(remaining) > 0:
+            if len(_active_load_stats) == 0:
+                member = _next_member(members, select, remaining)
+                if member is None:
+                    break
+                yield member.name, tar.extractfile(member)
+                continue
+
+            # read the member here, so that decompression is timed
+            with _stage('gunzip') as info:
+                member = _next_member(members, select, remaining)
+                data = None if member is None else (
+                    tar.extractfile(member).read())
+                info['nbytes'] = 0 if data is None else len(data)
+            if member is None:
+                break
+
+            yield member.name, io.BytesIO(data)
+
+    if remaining:
+        raise KeyError("Members not found in %r: %s" % (
+            filepath, ', '.join(sorted(remaining))))
+
+
+def unpickle_tar_members(filepath, names):
+    """Unpickle the named members of a gzipped tar archive in a single pass.
+
+    Returns a dictionary mapping each name to its unpickled contents.
+    See `.iter_tarfile`.
+    """
+    return dict((name, _unpickle(f))
+                for name, f in iter_tarfile(filepath, names))
+
+
+def get_cache_dir():
+    """Directory for cached datasets (``cache`` under ``data_dir``)"""
+    return os.path.join(os.path.expanduser(data_dir), 'cache')
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+def file_hash(filepath, blocksize=2**20):
+    """SHA-1 hash of the contents of a file.
+
+    Hashes are remembered in a small file next to the cache, keyed by the
+    file's size and modification time, so that large archives are only
+    hashed once.
+    """
+    filepath = os.path.expanduser(filepath)
+    stat = os.stat(filepath)
+    cache_dir = get_cache_dir()
+    hashpath = os.path.join(cache_dir, '%s.%d-%d.sha1' % (
+        os.path.basename(filepath), stat.st_size, int(stat.st_mtime)))
+    if os.path.exists(hashpath):
+        with open(hashpath, 'r') as f:
+            return f.read().strip()
+
+    sha1 = hashlib.sha1()
+    with _stage('hash', nbytes=stat.st_size), open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha1.update(block)
+    digest = sha1.hexdigest()
+
+    _makedirs(cache_dir)
+    with open(hashpath, 'w') as f:
+        f.write(digest)
+    return digest
+
+
+class _CachedArray(object):
+    """Placeholder for an array stored in its own ``.npy`` file"""
+
+    def __init__(self, index):
+        self.index = index
+
+
+def _cache_save(path, result):
+    arrays = []
+
+    def replace(x):
+        if isinstance(x, tuple):
+            return tuple(replace(xx) for xx in x)
+        elif isinstance(x, np.ndarray) and x.dtype != object:
+            arrays.append(x)
+            return _CachedArray(len(arrays) - 1)
+        return x
+
+    structure = replace(result)
+    for i, array in enumerate(arrays):
+        np.save(os.path.join(path, '%d.npy' % i), array)
+    with open(os.path.join(path, 'structure.pkl'), 'wb') as f:
+        pickle.dump(structure, f, protocol=2)
+    return sum(array.nbytes for array in arrays)
+
+
+def _cache_load(path, mmap_mode='r'):
+    with open(os.path.join(path, 'structure.pkl'), 'rb') as f:
+        structure = _unpickle(f)
+
+    def replace(x):
+        if isinstance(x, tuple):
+            return tuple(replace(xx) for xx in x)
+        elif isinstance(x, _CachedArray):
+            return np.load(os.path.join(path, '%d.npy' % x.index),
+                           mmap_mode=mmap_mode)
+        return x
+
+    return replace(structure)
+
+
+def cached_load(loader, filepath, **kwargs):
+    """Load a dataset through an uncompressed cache under ``data_dir``.
+
+    The first call runs ``loader(filepath, **kwargs)`` and stores the
+    arrays it returns as ``.npy`` files in the cache directory, keyed by
+    the hash of ``filepath`` and the loader arguments. Subsequent calls
+    return read-only memory-mapped views of the cached arrays, which load
+    almost instantly.
+
+    The ``load_*`` functions in this module call this when passed
+    ``cache=True``.
+    """
+    filepath = os.path.expanduser(filepath)
+    args = ','.join('%s=%r' % kv for kv in sorted(kwargs.items()))
+    key = '%s-%s-%s' % (
+        loader.__name__, file_hash(filepath)[:16],
+        hashlib.sha1(args.encode('utf-8')).hexdigest()[:8])
+    path = os.path.join(get_cache_dir(), key)
+
+    if not os.path.exists(path):
+        result = loader(filepath, **kwargs)
+
+        # write to a temporary directory first, so that other processes
+        # never see a partially written cache
+        _makedirs(get_cache_dir())
+        tmppath = tempfile.mkdtemp(prefix=key + '.', dir=get_cache_dir())
+        try:
+            with _stage('cache_save') as info:
+                info['nbytes'] = _cache_save(tmppath, result)
+            os.rename(tmppath, path)
+        except OSError:
+            if not os.path.exists(path):
+                raise
+        finally:
+            if os.path.exists(tmppath):
+                shutil.rmtree(tmppath)
+
+    with _stage('cache_load'):
+        return _cache_load(path)
+
+
+class Dataset(object):
+    """A dataset of ``(x, y)`` pairs that is loaded on demand.
+
+    Indexing with an integer returns a single ``(x, y)`` pair. Indexing with
+    a slice or an index array returns a tuple of arrays ``(X, Y)``, loading
+    only the parts of the dataset needed for those indices.
+    """
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def _known_length(self, n):
+        """A length that is correct for all indices less than ``n``."""
+        return len(self)
+
+    def _take(self, inds):
+        """Return ``(X[inds], Y[inds])`` for an array of valid indices."""
+        raise NotImplementedError()
+
+    def __getitem__(self, key):
+        if is_integer(key):
+            key = key if key >= 0 else key + len(self)
+            if key < 0 or key >= self._known_length(key + 1):
+                raise IndexError("Index out of range")
+            X, Y = self._take(np.array([key]))
+            return X[0], Y[0]
+        elif isinstance(key, slice):
+            bounded = (key.step is None or key.step > 0) and all(
+                i is not None and i >= 0 for i in (key.start or 0, key.stop))
+            n = self._known_length(key.stop) if bounded else len(self)
+            return self._take(np.arange(*key.indices(n)))
+
+        inds = np.asarray(key)
+        if inds.dtype == bool:
+            inds = np.nonzero(inds)[0]
+        inds = inds.astype(np.intp).ravel()
+        if len(inds) > 0 and inds.min() < 0:
+            inds = np.where(inds < 0, inds + len(self), inds)
+        if len(inds) > 0 and (inds.min() < 0 or inds.max() >= (
+                self._known_length(inds.max() + 1))):
+            raise IndexError("Index out of range")
+        return self._take(inds)
+
+    def iter_batches(self, batch_size, shuffle=False, rng=np.random):
+        """Iterate over the dataset in batches of ``(X, Y)`` arrays.
+
+        Parameters
+        ----------
+        batch_size : int
+            Number of examples in each batch (the last may be smaller).
+        shuffle : boolean (optional, Default: False)
+            Whether to present the examples in a random order. Otherwise,
+            they are presented in order, and parts of the dataset are only
+            loaded once they are reached.
+        rng : `numpy.random.RandomState` (optional)
+            Random number generator used for shuffling.
+        """
+        if shuffle:
+            order = rng.permutation(len(self))
+            for i in range(0, len(order), batch_size):
+                yield self[order[i:i+batch_size]]
+        else:
+            i = 0
+            while True:
+                X, Y = self[i:i+batch_size]
+                if len(X) == 0:
+                    break
+                yield X, Y
+                i += batch_size
+
+
+class ArrayDataset(Dataset):
+    """A `.Dataset` wrapping a pair of arrays.
+
+    Wrapping memory-mapped arrays (e.g. as loaded with ``cache=True``) means
+    only the indexed examples are read from disk.
+    """
+
+    def __init__(self, X, Y):
+        if len(X) != len(Y):
+            raise ValueError("X and Y must have the same length")
+        self.X = X
+        self.Y = Y
+
+    def __len__(self):
+        return len(self.X)
+
+    def _take(self, inds):
+        return self.X[inds], np.asarray(self.Y)[inds]
+
+
+class ArchiveDataset(Dataset):
+    """A `.Dataset` stored in batches in the members of a tar archive.
+
+    Members are only read once they are needed to access an index, and are
+    kept in memory afterwards. Since the members are compressed together,
+    accessing an index also reads all members before it.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the tar archive.
+    members : list of str
+        Names of the members containing the batches, in order.
+    read_member : callable
+        Function taking an open member file and returning the ``(X, Y)``
+        arrays of the batch it contains.
+    """
+
+    def __init__(self, filepath, members, read_member):
+        self.filepath = filepath
+        self.members = list(members)
+        self.read_member = read_member
+        self._batches = []
+        self._offsets = [0]
+        self._pending = {}  # members read ahead of the ones needed
+
+    def __len__(self):
+        return self._known_length(np.inf)
+
+    def _known_length(self, n):
+        def needed():
+            return (self._offsets[-1] < n
+                    and len(self._batches) < len(self.members))
+
+        def add_pending():
+            while needed() and (
+                    self.members[len(self._batches)] in self._pending):
+                name = self.members[len(self._batches)]
+                X, Y = self._pending.pop(name)
+                self._batches.append((X, np.asarray(Y)))
+                self._offsets.append(self._offsets[-1] + len(X))
+
+        if needed():
+            unread = set(self.members[len(self._batches):]).difference(
+                self._pending)
+            for name, f in iter_tarfile(self.filepath, unread):
+                self._pending[name] = self.read_member(f)
+                add_pending()
+                if not needed():
+                    break
+        return self._offsets[-1]
+
+    def _take(self, inds):
+        if len(self._batches) == 0:
+            return np.array([]), np.array([])
+
+        X0, Y0 = self._batches[0]
+        X = np.zeros((len(inds),) + X0.shape[1:], dtype=X0.dtype)
+        Y = np.zeros((len(inds),) + Y0.shape[1:], dtype=Y0.dtype)
+        batch = np.searchsorted(self._offsets, inds, side='right') - 1
+        for b in np.unique(batch):
+            m = batch == b
+            Xb, Yb = self._batches[b]
+            X[m] = Xb[inds[m] - self._offsets[b]]
+            Y[m] = Yb[inds[m] - self._offsets[b]]
+        return X, Y
+
+
+class PresentDataset(nengo.Process):
+    """Present images from a dataset, loading them in a background thread.
+
+    Like `nengo.processes.PresentInput`, each image is presented for
+    ``presentation_time`` in turn, starting over after the last image.
+    Images are read and preprocessed in batches by a background thread,
+    which keeps up to ``prefetch`` batches ready. The whole dataset therefore
+    never needs to be in memory (when using a lazy `.Dataset`).
+
+    Parameters
+    ----------
+    dataset : `.Dataset` or array_like
+        The images to present. For a `.Dataset`, the labels are ignored.
+    presentation_time : float
+        Time to present each image for.
+    batch_size : int (optional, Default: 100)
+        Number of images to load and preprocess at once.
+    prefetch : int (optional, Default: 2)
+        Maximum number of batches to load ahead of the simulation.
+    data_mean : array_like (optional)
+        Mean to subtract from each image.
+    whiten : `.ZCAWhiten` (optional)
+        Fitted whitening to apply to each batch (after subtracting the mean).
+    """
+
+    dataset = Parameter('dataset', readonly=True)
+    presentation_time = NumberParam('presentation_time', low=0, low_open=True)
+    batch_size = IntParam('batch_size', low=1)
+    prefetch = IntParam('prefetch', low=1)
+    data_mean = NdarrayParam('data_mean', shape=('...',), optional=True)
+    whiten = Parameter('whiten', optional=True, readonly=True)
+
+    def __init__(self, dataset, presentation_time, batch_size=100,
+                 prefetch=2, data_mean=None, whiten=None, **kwargs):
+        if not isinstance(dataset, Dataset):
+            dataset = np.asarray(dataset)
+            dataset = ArrayDataset(dataset, np.zeros(len(dataset)))
+        if len(dataset) == 0:
+            raise ValueError("Cannot present an empty dataset")
+        self.dataset = dataset
+        self.presentation_time = presentation_time
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.data_mean = data_mean
+        self.whiten = whiten
+
+        x, _ = dataset[0]
+        super(PresentDataset, self).__init__(
+            default_size_in=0, default_size_out=np.asarray(x).size, **kwargs)
+
+    def _preprocess(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(len(X), -1)
+        if self.data_mean is not None:
+            X = X - self.data_mean.ravel()
+        if self.whiten is not None:
+            X = self.whiten.transform(X, dtype=np.float64)
+        return X
+
+    def _load_batches(self, batches, stop, step_ref):
+        # `step_ref` keeps the weak reference (and its callback) alive
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            while True:
+                for X, _ in self.dataset.iter_batches(self.batch_size):
+                    if not put(self._preprocess(X)):
+                        return
+        except Exception as e:
+            put(e)
+
+    def make_step(self, shape_in, shape_out, dt, rng):
+        assert shape_in == (0,)
+        presentation_time = float(self.presentation_time)
+
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        state = {'start': 0, 'batch': np.zeros((0,) + shape_out)}
+
+        def step_presentdataset(t):
+            k = int((t-dt) / presentation_time + 1e-7)
+            while k >= state['start'] + len(state['batch']):
+                state['start'] += len(state['batch'])
+                state['batch'] = batches.get()
+                if isinstance(state['batch'], Exception):
+                    raise state['batch']
+            return state['batch'][k - state['start']]
+
+        # stop loading once the step function is no longer used
+        ref = weakref.ref(step_presentdataset, lambda _: stop.set())
+        thread = threading.Thread(
+            target=self._load_batches, args=(batches, stop, ref))
+        thread.daemon = True
+        thread.start()
+
+        return step_presentdataset
+
+
+def _lazy_sets(result, n_sets):
+    """Wrap the first ``n_sets`` ``(X, Y)`` pairs of a result in datasets"""
+    return tuple(ArrayDataset(*xy) for xy in result[:n_sets]) + tuple(
+        result[n_sets:])
+
+
+def _lazy_archive_sets(filepath, read_batch, member_lists, meta_name=None):
+    """Make an `.ArchiveDataset` for each list of members in an archive
+
+    Also returns the unpickled ``meta_name`` member, if given.
+    """
+    sets = tuple(ArchiveDataset(filepath, members, read_batch)
+                 for members in member_lists)
+    meta = None
+    if meta_name is not None:
+        meta = unpickle_tar_members(filepath, [meta_name])[meta_name]
+    return sets + (meta,)
+
+
+def load_cifar10(filepath=None, n_train=5, n_test=1, label_names=False,
+                 cache=False, lazy=False):
     """Load the CIFAR-10 dataset.
 
     Parameters
@@ -72,51 +686,73 @@ def load_cifar10(filepath=None, n_train=5, n_test=1, label_names=False):
         The number of testing batches to load (max: 1).
     label_names : boolean (optional, Default: False)
         Whether to provide the category label names.
+    cache : boolean (optional, Default: False)
+        Whether to load through an uncompressed cache under ``data_dir``
+        (see `.cached_load`). If True, arrays are read-only memory maps.
+    lazy : boolean (optional, Default: False)
+        Whether to return the training and testing sets as `.Dataset`
+        objects, which only read the batches that are indexed.
 
     Returns
     -------
     train_set : (n_train, n_pixels) ndarray, (n_train,) ndarray
         A tuple of the training image array and label array.
+        If ``lazy``, a `.Dataset` instead.
     test_set : (n_test, n_pixels) ndarray, (n_test,) ndarray
         A tuple of the testing image array and label array.
+        If ``lazy``, a `.Dataset` instead.
     label_names : list
         A list of the label names.
     """
     if filepath is None:
         filepath = get_cifar10_tar_gz()
 
+    filepath = os.path.expanduser(filepath)
+    if cache:
+        result = cached_load(load_cifar10, filepath, n_train=n_train,
+                             n_test=n_test, label_names=label_names)
+        return _lazy_sets(result, 2) if lazy else result
+
     # helper for reading each batch file
-    def read_tar_batch(tar, name):
-        data = unpickle_tarfile(tar, name)
+    def read_batch(f):
+        data = _unpickle(f)
         return data[b'data'], np.array(data[b'labels'])
 
-    filepath = os.path.expanduser(filepath)
-    with tarfile.open(filepath, 'r:gz') as tar:
-        if n_train < 1:
-            train = (np.array([]), np.array([]))
+    train_names = ['cifar-10-batches-py/data_batch_%d' % (i+1)
+                   for i in range(n_train)]
+    test_names = ['cifar-10-batches-py/test_batch'][:max(n_test, 0)]
+    meta_name = 'cifar-10-batches-py/batches.meta'
+
+    if lazy:
+        train, test, meta = _lazy_archive_sets(
+            filepath, read_batch, (train_names, test_names),
+            meta_name if label_names else None)
+        return (train, test) + (
+            (meta[b'label_names'],) if label_names else ())
+
+    batches = {}
+    members = train_names + test_names + ([meta_name] if label_names else [])
+    for name, f in iter_tarfile(filepath, members):
+        if name == meta_name:
+            names = _unpickle(f)[b'label_names']
         else:
-            train = ([], [])
-            for i in range(n_train):
-                data, labels = read_tar_batch(
-                    tar, 'cifar-10-batches-py/data_batch_%d' % (i+1))
-                train[0].append(data)
-                train[1].append(labels)
-
-            train = (np.vstack(train[0]), np.hstack(train[1]))
+            batches[name] = read_batch(f)
 
-        if n_test < 1:
-            test = (np.array([]), np.array([]))
-        else:
-            test = read_tar_batch(tar, 'cifar-10-batches-py/test_batch')
+    if n_train < 1:
+        train = (np.array([]), np.array([]))
+    else:
+        train = _concatenate([batches[name] for name in train_names])
 
-        if label_names:
-            meta = unpickle_tarfile(tar, 'cifar-10-batches-py/batches.meta')
-            names = meta[b'label_names']
+    if n_test < 1:
+        test = (np.array([]), np.array([]))
+    else:
+        test = batches[test_names[0]]
 
     return (train, test) + ((names,) if label_names else ())
 
 
-def load_cifar100(filepath=None, fine_labels=True, label_names=False):
+def load_cifar100(filepath=None, fine_labels=True, label_names=False,
+                  cache=False):
     """Load the CIFAR-100 dataset.
 
     Parameters
@@ -128,6 +764,9 @@ def load_cifar100(filepath=None, fine_labels=True, label_names=False):
         Whether to provide the fine labels or coarse labels.
     label_names : boolean (optional, Default: False)
         Whether to provide the category label names.
+    cache : boolean (optional, Default: False)
+        Whether to load through an uncompressed cache under ``data_dir``
+        (see `.cached_load`). If True, arrays are read-only memory maps.
 
     Returns
     -------
@@ -141,25 +780,30 @@ def load_cifar100(filepath=None, fine_labels=True, label_names=False):
     if filepath is None:
         filepath = get_cifar100_tar_gz()
 
+    filepath = os.path.expanduser(filepath)
+    if cache:
+        return cached_load(load_cifar100, filepath, fine_labels=fine_labels,
+                           label_names=label_names)
+
     # helper for reading each batch file
-    def read_tar_batch(tar, name):
-        data = unpickle_tarfile(tar, name)
+    def read_batch(data):
         return data[b'data'], np.array(
             data[b'fine_labels' if fine_labels else b'coarse_labels'])
 
-    filepath = os.path.expanduser(filepath)
-    with tarfile.open(filepath, 'r:gz') as tar:
-        train = read_tar_batch(tar, 'cifar-100-python/train')
-        test = read_tar_batch(tar, 'cifar-100-python/test')
-        if label_names:
-            meta = unpickle_tarfile(tar, 'cifar-100-python/meta')
-            names = meta[
-                b'fine_label_names' if fine_labels else b'coarse_label_names']
+    data = unpickle_tar_members(filepath, [
+        'cifar-100-python/train', 'cifar-100-python/test'] + (
+            ['cifar-100-python/meta'] if label_names else []))
+    train = read_batch(data['cifar-100-python/train'])
+    test = read_batch(data['cifar-100-python/test'])
+    if label_names:
+        meta = data['cifar-100-python/meta']
+        names = meta[
+            b'fine_label_names' if fine_labels else b'coarse_label_names']
 
     return (train, test) + ((names,) if label_names else ())
 
 
-def load_ilsvrc2012(filepath=None, n_files=None):
+def load_ilsvrc2012(filepath=None, n_files=None, cache=False, workers=None):
     """Load part of the ILSVRC 2012 (ImageNet) dataset.
 
     This loads a small section of the ImageNet Large Scale Visual Recognition
@@ -173,6 +817,13 @@ def load_ilsvrc2012(filepath=None, n_files=None):
         If `None`, the file will be downloaded to the current directory.
     n_files : int (optional, Default: None)
         Number of files (batches) to load from the archive. Defaults to all.
+    cache : boolean (optional, Default: False)
+        Whether to load through an uncompressed cache under ``data_dir``
+        (see `.cached_load`). If True, arrays are read-only memory maps.
+        This avoids decoding the JPEG images again on subsequent loads.
+    workers : int (optional, Default: None)
+        Number of processes to use for decoding the JPEG images. If `None`
+        or 1, images are decoded in this process.
 
     Returns
     -------
@@ -185,59 +836,132 @@ def load_ilsvrc2012(filepath=None, n_files=None):
     label_names : list
         A list of the label names.
     """
-    import PIL.Image  # ``pip install pillow``
-
     if filepath is None:
         filepath = get_ilsvrc2012_tar_gz()
 
+    filepath = os.path.expanduser(filepath)
+    if cache:
+        # ``workers`` does not change the result, so leave it out of the key
+        def loader(filepath, n_files):
+            return load_ilsvrc2012(filepath, n_files=n_files, workers=workers)
+        loader.__name__ = load_ilsvrc2012.__name__
+        return cached_load(loader, filepath, n_files=n_files)
+
     # helper for reading each batch file
-    def read_tar_batch(tar, name):
-        data = unpickle_tarfile(tar, name)
-        return data[b'data'], data[b'labels']  # JPEG strings, labels
+    regex = re.compile(r'.*/data_batch_([0-9]+\.[0-9]+)')
 
-    def bytes_to_array(b):
-        image = PIL.Image.open(io.BytesIO(b))
-        array = np.array(image, dtype=np.uint8).reshape(
-            image.size[0], image.size[1], 3)
-        array = np.transpose(array, (2, 0, 1))
-        return array
+    def select(name):
+        return name == 'batches.meta' or regex.match(name) is not None
 
-    filepath = os.path.expanduser(filepath)
-    with tarfile.open(filepath, 'r:gz') as tar:
-        names = tar.getnames()
-        regex = re.compile(r'.*/data_batch_([0-9]+\.[0-9]+)')
-        matches = [regex.match(name) for name in names]
-        matches = [match for match in matches if match]
-
-        batchfiles = {}
-        for match in matches:
-            batchfiles[float(match.groups()[-1])] = match.group()
-
-        raw_images = []
-        raw_labels = []
-        for key in sorted(list(batchfiles))[:n_files]:
-            batchfile = batchfiles[key]
-            x, y = read_tar_batch(tar, batchfile)
-            raw_images.extend(x)
-            raw_labels.extend(y)
-
-        n_images = len(raw_images)
-        image_shape = bytes_to_array(raw_images[0]).shape
-        images = np.zeros((n_images,) + image_shape, dtype=np.uint8)
-        for i, s in enumerate(raw_images):
-            images[i] = bytes_to_array(s)
-
-        labels = np.array(raw_labels)
-        labels.shape = (n_images,)
-
-        meta = unpickle_tarfile(tar, 'batches.meta')
-        data_mean = meta[b'data_mean'].reshape(image_shape)
-        label_names = meta[b'label_names']
+    # read the archive in one pass, keeping the first `n_files` batches
+    batches = {}
+    for name, f in iter_tarfile(filepath, select):
+        if name == 'batches.meta':
+            meta = _unpickle(f)
+            continue
+
+        key = float(regex.match(name).groups()[-1])
+        if n_files is not None and len(batches) >= n_files:
+            if key > max(batches):
+                continue
+            del batches[max(batches)]
+
+        data = _unpickle(f)
+        batches[key] = data[b'data'], data[b'labels']  # JPEG strings, labels
+
+    raw_images = []
+    raw_labels = []
+    for key in sorted(batches):
+        x, y = batches[key]
+        raw_images.extend(x)
+        raw_labels.extend(y)
+
+    with _stage('decode', nbytes=sum(len(b) for b in raw_images)):
+        images = decode_jpegs(raw_images, workers=workers)
+
+    labels = np.array(raw_labels)
+    labels.shape = (len(images),)
+
+    data_mean = meta[b'data_mean'].reshape(images.shape[1:])
+    label_names = meta[b'label_names']
 
     return images, labels, data_mean, label_names
 
 
-def load_mnist(filepath=None, validation=False):
+def _jpeg_to_array(b):
+    import PIL.Image  # ``pip install pillow``
+
+    image = PIL.Image.open(io.BytesIO(b))
+    array = np.array(image, dtype=np.uint8).reshape(
+        image.size[0], image.size[1], 3)
+    array = np.transpose(array, (2, 0, 1))
+    return array
+
+
+_decode_target = None  # images array shared with `.decode_jpegs` workers
+
+
+def _init_decode_worker(buffer, shape):
+    global _decode_target
+    _decode_target = np.frombuffer(buffer, dtype=np.uint8).reshape(shape)
+
+
+def _decode_jpegs_into(args):
+    start, jpegs = args
+    for i, b in enumerate(jpegs):
+        _decode_target[start + i] = _jpeg_to_array(b)
+
+
+def decode_jpegs(jpegs, workers=None):
+    """Decode a list of equally sized JPEG images into one array.
+
+    Parameters
+    ----------
+    jpegs : list of bytes
+        The encoded JPEG images.
+    workers : int (optional, Default: None)
+        Number of processes to use. The processes write their images directly
+        into the returned array, which is allocated in shared memory, so that
+        decoded images are neither sent between processes nor copied. If
+        `None` or 1, images are decoded in this process.
+
+    Returns
+    -------
+    images : (n_images, nc, ny, nx) ndarray
+        The decoded images.
+    """
+    first = _jpeg_to_array(jpegs[0])
+    shape = (len(jpegs),) + first.shape
+
+    if workers is None or workers <= 1 or len(jpegs) < 2:
+        images = np.zeros(shape, dtype=np.uint8)
+        for i, b in enumerate(jpegs):
+            images[i] = _jpeg_to_array(b)
+        return images
+
+    import ctypes
+    import multiprocessing
+
+    buffer = multiprocessing.RawArray(ctypes.c_uint8, int(np.prod(shape)))
+    images = np.frombuffer(buffer, dtype=np.uint8).reshape(shape)
+
+    n_chunks = min(4 * workers, len(jpegs))
+    bounds = np.linspace(0, len(jpegs), n_chunks + 1).astype(int)
+    tasks = [(i0, jpegs[i0:i1]) for i0, i1 in zip(bounds[:-1], bounds[1:])]
+
+    # the buffer can only be shared when the workers are started
+    pool = multiprocessing.Pool(
+        workers, initializer=_init_decode_worker, initargs=(buffer, shape))
+    try:
+        pool.map(_decode_jpegs_into, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    return images
+
+
+def load_mnist(filepath=None, validation=False, cache=False):
     """Load the MNIST dataset.
 
     Parameters
@@ -248,6 +972,9 @@ def load_mnist(filepath=None, validation=False):
     validation : boolean (optional, Default: False)
         Whether to provide the validation data as a separate set (True),
         or combine it into the training data (False).
+    cache : boolean (optional, Default: False)
+        Whether to load through an uncompressed cache under ``data_dir``
+        (see `.cached_load`). If True, arrays are read-only memory maps.
 
     Returns
     -------
@@ -262,19 +989,23 @@ def load_mnist(filepath=None, validation=False):
         filepath = get_mnist_pkl_gz()
 
     filepath = os.path.expanduser(filepath)
-    with gzip.open(filepath, 'rb') as f:
-        train_set, valid_set, test_set = pickle_load_bytes(f)
+    if cache:
+        return cached_load(load_mnist, filepath, validation=validation)
+
+    with _stage('gunzip') as info, gzip.open(filepath, 'rb') as f:
+        data = f.read()
+        info['nbytes'] = len(data)
+    train_set, valid_set, test_set = _unpickle(io.BytesIO(data))
 
     if validation:
         return train_set, valid_set, test_set
     else:  # combine valid into train
-        train_set = (np.vstack((train_set[0], valid_set[0])),
-                     np.hstack((train_set[1], valid_set[1])))
+        train_set = _concatenate([train_set, valid_set])
         return train_set, test_set
 
 
 def load_svhn(filepath=None, n_train=9, n_test=3, data_mean=False,
-              label_names=False):
+              label_names=False, cache=False, lazy=False):
     """Load the SVHN dataset.
 
     Parameters
@@ -288,13 +1019,21 @@ def load_svhn(filepath=None, n_train=9, n_test=3, data_mean=False,
         The number of testing batches to load (max: 1).
     label_names : boolean (optional, Default: False)
         Whether to provide the category label names.
+    cache : boolean (optional, Default: False)
+        Whether to load through an uncompressed cache under ``data_dir``
+        (see `.cached_load`). If True, arrays are read-only memory maps.
+    lazy : boolean (optional, Default: False)
+        Whether to return the training and testing sets as `.Dataset`
+        objects, which only read the batches that are indexed.
 
     Returns
     -------
     train_set : (n_train, n_pixels) ndarray, (n_train,) ndarray
         A tuple of the training image array and label array.
+        If ``lazy``, a `.Dataset` instead.
     test_set : (n_test, n_pixels) ndarray, (n_test,) ndarray
         A tuple of the testing image array and label array.
+        If ``lazy``, a `.Dataset` instead.
     label_names : list
         A list of the label names.
     """
@@ -303,34 +1042,47 @@ def load_svhn(filepath=None, n_train=9, n_test=3, data_mean=False,
     if filepath is None:
         filepath = get_svhn_tar_gz()
 
-    def read_tar_batch(tar, name):
-        data = unpickle_tarfile(tar, name)
-        return data[b'data'], np.array(data[b'labels'])
-
-    def load_batches(tar, inds):
-        if len(inds) < 1:
-            return (np.array([]), np.array([]))
-
-        batches = ([], [])
-        for i in inds:
-            data, labels = read_tar_batch(
-                tar, 'svhn-py-colmajor/data_batch_%d' % i)
-            batches[0].append(data.T)
-            batches[1].append(labels)
-
-        return (np.vstack(batches[0]).reshape((-1,) + shape),
-                np.hstack(batches[1]))
-
     filepath = os.path.expanduser(filepath)
-    with tarfile.open(filepath, 'r:gz') as tar:
-        train = load_batches(tar, list(range(1, n_train+1)))
-        test = load_batches(tar, list(range(10, n_test+10)))
-
-        if label_names or data_mean:
-            meta = unpickle_tarfile(tar, 'svhn-py-colmajor/batches.meta')
-        data_mean = (meta[b'data_mean'].reshape(shape),) if data_mean else ()
-        label_names = (meta[b'label_names'],) if label_names else ()
-
+    if cache:
+        result = cached_load(load_svhn, filepath, n_train=n_train,
+                             n_test=n_test, data_mean=data_mean,
+                             label_names=label_names)
+        return _lazy_sets(result, 2) if lazy else result
+
+    def read_batch(f):
+        data = _unpickle(f)
+        return data[b'data'].T.reshape((-1,) + shape), np.array(
+            data[b'labels'])
+
+    name = 'svhn-py-colmajor/data_batch_%d'
+    train_names = [name % i for i in range(1, n_train+1)]
+    test_names = [name % i for i in range(10, n_test+10)]
+    meta_name = 'svhn-py-colmajor/batches.meta'
+    meta_names = [meta_name] if label_names or data_mean else []
+
+    if lazy:
+        train, test, meta = _lazy_archive_sets(
+            filepath, read_batch, (train_names, test_names),
+            meta_names[0] if meta_names else None)
+    else:
+        batches = {}
+        members = train_names + test_names + meta_names
+        for member, f in iter_tarfile(filepath, members):
+            if member == meta_name:
+                meta = _unpickle(f)
+            else:
+                batches[member] = read_batch(f)
+
+        def load_batches(names):
+            if len(names) < 1:
+                return (np.array([]), np.array([]))
+            return _concatenate([batches[n] for n in names])
+
+        train = load_batches(train_names)
+        test = load_batches(test_names)
+
+    data_mean = (meta[b'data_mean'].reshape(shape),) if data_mean else ()
+    label_names = (meta[b'label_names'],) if label_names else ()
     return (train, test) + data_mean + label_names
 
 
@@ -391,7 +1143,7 @@ def spasafe_names(label_names, pre_comma_only=True):
     return vocab_names
 
 
-def one_hot_from_labels(labels, classes=None, dtype=float):
+def one_hot_from_labels(labels, classes=None, dtype=float, sparse=False):
     """Turn integer labels into a one-hot encoding.
 
     Parameters
@@ -405,6 +1157,10 @@ def one_hot_from_labels(labels, classes=None, dtype=float):
         unique elements in ``labels``).
     dtype : dtype (optional)
         Data type of returned one-hot encoding (defaults to ``float``).
+        A small type like ``np.uint8`` gives a more compact dense encoding.
+    sparse : boolean (optional)
+        Whether to return the encoding as a ``scipy.sparse.csr_matrix``,
+        which stores only the ``n`` nonzero elements (defaults to False).
     """
     assert labels.ndim == 1
     n = labels.shape[0]
@@ -412,58 +1168,125 @@ def one_hot_from_labels(labels, classes=None, dtype=float):
     if np.issubdtype(labels.dtype, np.integer) and (
             classes is None or is_integer(classes)):
         index = labels
-        index_min, index_max = index.min(), index.max()
+        index_max = index.max() if n > 0 else -1
         n_classes = (index_max + 1) if classes is None else classes
-        assert index_min >= 0
+        assert n == 0 or index.min() >= 0
         assert index_max < n_classes
+    elif classes is None:
+        classes, index = np.unique(labels, return_inverse=True)
+        n_classes = len(classes)
     else:
-        if classes is not None:
-            assert is_iterable(classes)
-            assert set(np.unique(labels)).issubset(classes)
-        classes = np.unique(labels) if classes is None else classes
+        assert is_iterable(classes)
+        classes = np.asarray(classes)
         n_classes = len(classes)
 
         c_index = np.argsort(classes)
         c_sorted = classes[c_index]
-        index = c_index[np.searchsorted(c_sorted, labels)]
+        i_sorted = np.searchsorted(c_sorted, labels)
+        found = i_sorted < n_classes  # not beyond the largest class
+        found[found] = c_sorted[i_sorted[found]] == labels[found]
+        assert found.all(), "classes must contain all labels"
+        index = c_index[i_sorted]
+
+    if sparse:
+        import scipy.sparse  # ``pip install scipy``
+
+        return scipy.sparse.csr_matrix(
+            (np.ones(n, dtype=dtype), index, np.arange(n + 1)),
+            shape=(n, n_classes))
 
     y = np.zeros((n, n_classes), dtype=dtype)
     y[np.arange(n), index] = 1
     return y
 
 
+def _dot_into(a, b, out):
+    if out.flags.c_contiguous:
+        np.dot(a, b, out=out)
+    else:
+        out[...] = np.dot(a, b)
+
+
 class ZCAWhiten(object):
     """ZCA Whitening
 
+    The transform can be fit all at once with `.fit`, or incrementally over
+    chunks of a dataset that may not fit in memory with `.partial_fit`,
+    followed by `.finalize`.
+
+    For high-dimensional data, setting ``n_components`` whitens only the
+    top principal components, estimated with a randomized single-pass
+    Nystrom approximation [3]_ of the covariance. The remaining directions
+    are scaled uniformly, using their average variance (plus ``gamma``).
+    Fitting time and memory then scale with ``dims * n_components`` rather
+    than ``dims**2``, and ``Sinv`` is not formed. The sketch underestimates
+    the variances of the components, so `.fit` computes them exactly with
+    a second pass over the data; after `.partial_fit`, use `.refine`.
+
+    Parameters
+    ----------
+    beta : float (optional, Default: 1e-2)
+        Minimum squared norm used when contrast-normalizing each example.
+    gamma : float (optional, Default: 1e-5)
+        Regularization added to the covariance eigenvalues.
+    n_components : int (optional)
+        Number of principal components to whiten exactly. If `None`, the
+        full covariance is used.
+    n_oversamples : int (optional, Default: 10)
+        Number of extra random directions used to estimate the components.
+    rng : `numpy.random.RandomState` (optional)
+        Random number generator for the low-rank approximation.
+
     References
     ----------
     .. [1] Krizhevsky, Alex. "Learning multiple layers of features from tiny
            images" (2009) MSc Thesis, Dept. of Comp. Science, Univ. of
            Toronto. pp. 48-49.
+    .. [2] Chan, Tony F., Golub, Gene H., and LeVeque, Randall J. "Updating
+           formulae and a pairwise algorithm for computing sample variances"
+           (1979) Stanford University Technical Report STAN-CS-79-773.
+    .. [3] Tropp, Joel A., Yurtsever, Alp, Udell, Madeleine, and Cevher,
+           Volkan. "Fixed-rank approximation of a positive-semidefinite
+           matrix from streaming data" (2017) NIPS. pp. 1225-1234.
     """
 
-    def __init__(self, beta=1e-2, gamma=1e-5):
+    def __init__(self, beta=1e-2, gamma=1e-5, n_components=None,
+                 n_oversamples=10, rng=np.random):
         self.beta = beta
         self.gamma = gamma
+        self.n_components = n_components
+        self.n_oversamples = n_oversamples
+        self.rng = rng
 
         self.dims = None
         self.pixel_mu = None
         self.e = None
         self.V = None
+        self.e_rest = None
         self.Sinv = None
 
+        self.n_samples = 0
+        self._scatter = None  # scatter matrix, or its sketch if low-rank
+        self._trace = None
+        self._omega = None
+        self._cast = {}  # transform parameters cast to other dtypes
+
     def contrast_normalize(self, X, remove_mean=True, beta=None,
-                           hard_beta=True):
-        X = np.asarray(X, dtype=np.float64)
+                           hard_beta=True, dtype=np.float64):
+        X = np.asarray(X, dtype=dtype)
         if X.ndim != 2:
             raise ValueError('contrast_normalize requires flat patches')
 
         Xc = X - X.mean(axis=1)[:, None] if remove_mean else X
-        l2 = (Xc * Xc).sum(axis=1)
+        l2 = np.einsum('ij,ij->i', Xc, Xc)
 
         beta = self.beta if beta is None else beta
         div2 = np.maximum(l2, beta) if hard_beta else l2 + beta
-        return Xc / np.sqrt(div2[:, None])
+        scale = (1. / np.sqrt(div2))[:, None]
+        if remove_mean:
+            Xc *= scale  # `Xc` is already a copy
+            return Xc
+        return Xc * scale
 
     def fit(self, X):
         """Fit whitening transform to training data
@@ -473,26 +1296,207 @@ class ZCAWhiten(object):
         X : array_like
             Flattened data, with each row corresponding to one example
         """
-        X = self.contrast_normalize(X)
-        self.dims = X.shape[1]
+        X = np.asarray(X)
+        self.n_samples = 0
+        self.partial_fit(X)
+        self.finalize()
+        if self.Sinv is None:
+            self.refine(X)
+        return self.transform(X, dtype=np.float64)
+
+    def partial_fit(self, X):
+        """Update the whitening statistics with a chunk of training data
 
-        self.pixel_mu = X.mean(axis=0)
-        X -= self.pixel_mu[None, :]  # each pixel has zero mean
+        The mean and covariance are accumulated with the pairwise update
+        of [2]_, which remains accurate over many chunks. Call `.finalize`
+        after the last chunk to compute the whitening transform.
 
-        S = np.dot(X.T, X) / (X.shape[0] - 1)
+        Parameters
+        ----------
+        X : array_like
+            Flattened data, with each row corresponding to one example
+        """
+        X = self.contrast_normalize(X)
+        n = X.shape[0]
+        if self.n_samples == 0:
+            self._start_fit(X.shape[1])
+        elif X.shape[1] != self.dims:
+            raise ValueError("Expected %d dimensions, got %d"
+                             % (self.dims, X.shape[1]))
+        if n == 0:
+            return self
+
+        mu = X.mean(axis=0)
+        X -= mu[None, :]
+        delta = mu - self.pixel_mu
+        n_total = self.n_samples + n
+        c = self.n_samples * n / float(n_total)
+
+        if self._omega is None:
+            self._scatter += np.dot(X.T, X)
+            self._scatter += c * np.outer(delta, delta)
+        else:
+            # only track the product of the scatter matrix with `omega`
+            self._scatter += np.dot(X.T, np.dot(X, self._omega))
+            self._scatter += c * np.outer(delta, np.dot(delta, self._omega))
+            self._trace += np.einsum('ij,ij->', X, X) + c * np.dot(
+                delta, delta)
+
+        self.pixel_mu += (n / float(n_total)) * delta
+        self.n_samples = n_total
+        return self
+
+    def _start_fit(self, dims):
+        self.dims = dims
+        self.pixel_mu = np.zeros(dims)
+        if self.n_components is None:
+            self._omega = None
+            self._scatter = np.zeros((dims, dims))
+        else:
+            n_sketch = min(self.n_components + self.n_oversamples, dims)
+            self._omega, _ = np.linalg.qr(
+                self.rng.normal(size=(dims, n_sketch)))
+            self._scatter = np.zeros((dims, n_sketch))
+            self._trace = 0.
+
+    def finalize(self):
+        """Compute the whitening transform from the accumulated statistics"""
+        if self.n_samples < 2:
+            raise ValueError("Need at least two samples to fit whitening")
+
+        self._cast = {}
+        if self._omega is not None:
+            return self._finalize_lowrank()
+
+        S = self._scatter / (self.n_samples - 1)
         e, V = np.linalg.eigh(S)
         self.e = e
         self.V = V
 
         self.Sinv = np.dot(np.sqrt(1.0 / (e + self.gamma)) * V, V.T)
+        return self
+
+    def _finalize_lowrank(self):
+        # Nystrom approximation S ~= (S O) (O^T S O)^-1 (S O)^T, see [3]_
+        omega = self._omega
+        Y = self._scatter / (self.n_samples - 1)
+        nu = np.sqrt(self.dims) * np.finfo(Y.dtype).eps * np.linalg.norm(Y)
+        Y = Y + nu * omega  # shift for numerical stability
+        L = np.linalg.cholesky(np.dot(omega.T, Y))
+        B = np.linalg.solve(L, Y.T).T
+        U, sigma, _ = np.linalg.svd(B, full_matrices=False)
+
+        k = min(self.n_components, self.dims)
+        self.e = np.maximum(sigma[:k]**2 - nu, 0)
+        self.V = U[:, :k]
+
+        self._set_e_rest()
+        self.Sinv = None
+        return self
 
-        return np.dot(X, self.Sinv)
+    def _set_e_rest(self):
+        # remaining directions get their average variance
+        trace = self._trace / (self.n_samples - 1)
+        n_rest = self.dims - len(self.e)
+        self.e_rest = (max(trace - self.e.sum(), 0) / n_rest if n_rest > 0
+                       else 0.)
 
-    def transform(self, X):
-        assert self.dims is not None
+    def refine(self, X):
+        """Compute the variances of the low-rank components exactly
 
-        X = self.contrast_normalize(X, beta=self.beta)
-        assert X.shape[1] == self.dims
+        After `.finalize` with ``n_components``, the variances along the
+        components (``e``) come from the sketch, which underestimates them,
+        so that the average variance of the remaining directions
+        (``e_rest``) is overestimated. This computes both exactly with a
+        second pass over the training data. `.fit` does this itself.
 
-        X -= self.pixel_mu[None, :]
-        return np.dot(X, self.Sinv)
+        Parameters
+        ----------
+        X : ndarray, or iterable of ndarray
+            All of the training data passed to `.partial_fit`, either as
+            one array or as an iterable of chunks.
+        """
+        assert self.V is not None and self.Sinv is None
+        chunks = [X] if isinstance(X, np.ndarray) else X
+
+        n = 0
+        sumsq = np.zeros(self.V.shape[1])
+        for Xi in chunks:
+            Xi = self.contrast_normalize(Xi)
+            Xi -= self.pixel_mu[None, :]
+            sumsq += (np.dot(Xi, self.V)**2).sum(axis=0)
+            n += Xi.shape[0]
+        if n != self.n_samples:
+            raise ValueError("Expected the %d fitted examples, got %d"
+                             % (self.n_samples, n))
+
+        self.e = sumsq / (self.n_samples - 1)
+        self._set_e_rest()
+        self._cast = {}
+        return self
+
+    def transform(self, X, out=None, batch_size=None, dtype=np.float32):
+        """Whiten data using the fitted transform
+
+        Parameters
+        ----------
+        X : (n, dims) array_like
+            Flattened data, with each row corresponding to one example.
+        out : (n, dims) ndarray (optional)
+            Array in which to place the result. If given, its dtype is used
+            in place of ``dtype``.
+        batch_size : int (optional)
+            Number of examples to whiten at once. Temporary arrays are only
+            allocated for one batch at a time. Defaults to all examples.
+        dtype : dtype (optional, Default: ``np.float32``)
+            Data type used for the computation and the result.
+
+        Returns
+        -------
+        out : (n, dims) ndarray
+            The whitened data.
+        """
+        assert self.V is not None
+
+        X = np.asarray(X)
+        n = X.shape[0]
+        if X.ndim != 2 or X.shape[1] != self.dims:
+            raise ValueError("Expected data with shape (n, %d), got %s"
+                             % (self.dims, X.shape))
+
+        if out is None:
+            out = np.empty((n, self.dims), dtype=dtype)
+        elif out.shape != (n, self.dims):
+            raise ValueError("Expected 'out' with shape %s, got %s"
+                             % ((n, self.dims), out.shape))
+        dtype = out.dtype
+
+        if dtype not in self._cast:
+            self._cast[dtype] = self._transform_params(dtype)
+        pixel_mu, Sinv, V, scale, scale_rest = self._cast[dtype]
+
+        batch_size = max(n, 1) if batch_size is None else batch_size
+        for i in range(0, n, batch_size):
+            Xi = self.contrast_normalize(
+                X[i:i+batch_size], beta=self.beta, dtype=dtype)
+            Xi -= pixel_mu[None, :]
+            outi = out[i:i+batch_size]
+            if Sinv is not None:
+                _dot_into(Xi, Sinv, outi)
+            else:
+                # scale the top components, and the remainder uniformly
+                _dot_into(np.dot(Xi, V) * scale, V.T, outi)
+                Xi *= scale_rest
+                outi += Xi
+
+        return out
+
+    def _transform_params(self, dtype):
+        pixel_mu = self.pixel_mu.astype(dtype)
+        if self.Sinv is not None:
+            return pixel_mu, self.Sinv.astype(dtype), None, None, None
+
+        scale_rest = 1. / np.sqrt(self.e_rest + self.gamma)
+        scale = 1. / np.sqrt(self.e + self.gamma) - scale_rest
+        return (pixel_mu, None, self.V.astype(dtype), scale.astype(dtype),
+                dtype.type(scale_rest))
@@ -9,13 +9,19 @@ Notes:
 
 from __future__ import absolute_import
 
+import collections
+import importlib
+import json
+
 import numpy as np
 
 import nengo
 from nengo.params import Default
+from nengo.utils.compat import is_number
 from nengo.utils.network import with_self
 
-from .convnet import Conv2d, Pool2d, softmax
+from .convnet import (
+    Conv2d, Pool2d, quantize_int8, quantized_buffer, quantized_dot, softmax)
 from .neurons import SoftLIFRate
 
 
@@ -72,6 +78,18 @@ class Network(nengo.Network):
         layer = PoolLayer(input_shape, pool_size, **kwargs)
         return self.add_layer(layer, inputs=inputs, name=name)
 
+    @with_self
+    def add_sum_layer(self, size, inputs=None, name=None, **kwargs):
+        kwargs.setdefault('label', name)
+        layer = SumLayer(size, **kwargs)
+        return self.add_layer(layer, inputs=inputs, name=name)
+
+    @with_self
+    def add_concat_layer(self, sizes, inputs=None, name=None, **kwargs):
+        kwargs.setdefault('label', name)
+        layer = ConcatLayer(sizes, **kwargs)
+        return self.add_layer(layer, inputs=inputs, name=name)
+
     def compute(self, inputs, output):
         raise NotImplementedError()
 
@@ -156,71 +174,178 @@ class SequentialNetwork(Network):
                 y[i:i+batch_size] = f(x[i:i+batch_size])
             return y
 
+    def save(self, path):
+        """Save the layers and their parameters to an ``.npz`` file.
+
+        The network can be recreated with `.SequentialNetwork.load`, without
+        the framework (e.g. Keras) that it was originally converted from.
+        """
+        names = dict(
+            (layer, name) for name, layer in self.layers_by_name.items())
+        specs = []
+        arrays = {}
+        for i, layer in enumerate(self.layers):
+            spec = dict(type=_type_path(type(layer)), name=names.get(layer),
+                        label=layer.label, args={}, arrays=[], objects={})
+            for key, value in layer._save_args().items():
+                if isinstance(value, np.ndarray):
+                    arrays['%d_%s' % (i, key)] = value
+                    spec['arrays'].append(key)
+                elif isinstance(value, (nengo.neurons.NeuronType,
+                                        nengo.synapses.Synapse)):
+                    spec['objects'][key] = _object_spec(value)
+                else:
+                    spec['args'][key] = value
+            specs.append(spec)
+
+        layers = json.dumps(dict(version=1, layers=specs))
+        np.savez(path, layers=np.array(layers), **arrays)
+
+    @staticmethod
+    def load(path, **kwargs):
+        """Recreate a network saved with `.SequentialNetwork.save`.
+
+        Keyword arguments are passed to the new `.SequentialNetwork`.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            specs = json.loads(data['layers'].item())
+            if specs['version'] != 1:
+                raise ValueError("Unsupported file version %r"
+                                 % specs['version'])
+
+            net = SequentialNetwork(**kwargs)
+            for i, spec in enumerate(specs['layers']):
+                args = dict(spec['args'])
+                args.update((key, np.array(data['%d_%s' % (i, key)]))
+                            for key in spec['arrays'])
+                args.update((key, _from_object_spec(
+                    obj, (nengo.neurons.NeuronType, nengo.synapses.Synapse)))
+                    for key, obj in spec['objects'].items())
+                with net:
+                    layer = _import_type(spec['type'], Layer)(
+                        label=spec['label'], **args)
+                net.add_layer(layer, name=spec['name'])
+
+        return net
+
+
+class TreeNetwork(Network):
+    """Network whose layers form a directed acyclic graph.
+
+    Layers can have several inputs (see `.MergeLayer`), and the output of a
+    layer can feed any number of later layers, with a single connection each.
+    Layers must be added after all of their inputs.
+    """
 
-# class TreeNetwork(Network):
-#     def __init__(self, **kwargs):
-#         super(TreeNetwork, self).__init__(**kwargs)
+    def __init__(self, **kwargs):
+        super(TreeNetwork, self).__init__(**kwargs)
 
-#         self.inputs = {}  # name -> input object
-#         self.outputs = {}  # name -> output object
-#         self.layer_inputs = {}  # mapping layer to its input layers
-#         self.layers_by_name = {}
+        self.inputs = collections.OrderedDict()  # name -> input object
+        self.outputs = collections.OrderedDict()  # name -> output object
+        self.layer_inputs = collections.OrderedDict()  # layer -> input layers
+        self.layers_by_name = {}
 
-#     @property
-#     def layers(self):
-#         return list(self.layer_inputs)
-
-#     @with_self
-#     def add_layer(self, inputs, layer, name=None):
-#         assert isinstance(layer, Layer)
-#         assert layer not in self.layer_inputs
-#         for i in inputs:
-#             assert i in self.layer_inputs
-#             nengo.Connection(
-#                 i.output, layer.input, synapse=None, **layer.pre_args)
-
-#         self.layer_inputs[layer] = tuple(inputs)
-#         if name is not None:
-#             assert name not in self.layers_by_name
-#             self.layers_by_name[name] = layer
-
-#         return layer
-
-#     @with_self
-#     def add_named_input(self, name, d, **kwargs):
-#         kwargs.setdefault('label', name)
-#         layer = DataLayer(d, **kwargs)
-#         self.inputs[name] = layer.input
-#         return self.add_layer(layer, inputs=(), name=name)
-
-#     def add_named_output(self, name, obj):
-#         output = obj.output
-#         self.outputs[name] = output
-#         return output
-
-#     def compute(self, inputs, output):
-#         raise NotImplementedError(
-#             "Layers currently only handle one input for compute")
-
-#         assert isinstance(inputs, dict)
-
-#         def as_layer(x):
-#             if isinstance(x, str):
-#                 return self.layers_by_name[x]
-#             else:
-#                 assert x in self.layer_inputs
-#                 return x
-
-#         if any(isinstance(i, str) for i in inputs):
-#             inputs = dict((as_layer(k), v) for k, v in inputs.items())
-#         else:
-#             assert all(i in self.layer_inputs for i in inputs)
-#         output = as_layer(output)
-
-#         layer_inputs = [inputs[i] if i in inputs else self.compute(inputs, i)
-#                         for i in self.layer_inputs[output]]
-#         assert len(layer_inputs) == 1
-#         return output.compute(layer_inputs[0])
+    @property
+    def layers(self):
+        return list(self.layer_inputs)
+
+    @property
+    def input(self):
+        if len(self.inputs) != 1:
+            raise ValueError("Network has %d inputs; use `inputs`"
+                             % len(self.inputs))
+        return next(iter(self.inputs.values()))
+
+    @property
+    def output(self):
+        if len(self.outputs) == 0:
+            return (None if len(self.layer_inputs) == 0 else
+                    self.layers[-1].output)
+        elif len(self.outputs) > 1:
+            raise ValueError("Network has %d outputs; use `outputs`"
+                             % len(self.outputs))
+        return next(iter(self.outputs.values()))
+
+    @with_self
+    def add_layer(self, layer, inputs=None, name=None):
+        assert isinstance(layer, Layer)
+        assert layer not in self.layer_inputs
+
+        if inputs is None:
+            inputs = self.layers[-1:]
+
+        for k, i in enumerate(inputs):
+            assert i in self.layer_inputs
+            nengo.Connection(
+                i.output, layer.input_for(k), synapse=None, **layer.pre_args)
+
+        self.layer_inputs[layer] = tuple(inputs)
+        if name is not None:
+            assert name not in self.layers_by_name
+            self.layers_by_name[name] = layer
+
+        return layer
+
+    @with_self
+    def add_named_input(self, name, d, **kwargs):
+        kwargs.setdefault('label', name)
+        layer = DataLayer(d, **kwargs)
+        self.inputs[name] = layer.input
+        return self.add_layer(layer, inputs=(), name=name)
+
+    def add_named_output(self, name, obj):
+        output = obj.output
+        self.outputs[name] = output
+        return output
+
+    def _as_layer(self, x):
+        if isinstance(x, str):
+            return self.layers_by_name[x]
+        else:
+            assert x in self.layer_inputs
+            return x
+
+    def compute(self, inputs, output_layer=None):
+        """Compute the output of a layer, given values for the inputs.
+
+        Parameters
+        ----------
+        inputs : dict or array_like
+            Maps input layers (or their names) to ``(n, size)`` arrays.
+            Can be a single array if the network has one input.
+        output_layer : Layer or str, optional
+            Layer whose output to compute. Defaults to the last layer.
+        """
+        if not isinstance(inputs, dict):
+            assert len(self.inputs) == 1
+            inputs = {next(iter(self.inputs)): inputs}
+        inputs = dict((self._as_layer(k), v) for k, v in inputs.items())
+        output_layer = self.layers[-1] if output_layer is None else (
+            self._as_layer(output_layer))
+
+        # only compute the layers that the output depends on, each once
+        needed = set()
+        stack = [output_layer]
+        while len(stack) > 0:
+            layer = stack.pop()
+            if layer not in needed:
+                needed.add(layer)
+                stack.extend(self.layer_inputs[layer])
+
+        values = {}
+        for layer, layer_inputs in self.layer_inputs.items():
+            if layer not in needed:
+                continue
+            if len(layer_inputs) == 0:
+                x = inputs[layer]
+            elif isinstance(layer, MergeLayer):
+                x = [values[i] for i in layer_inputs]
+            else:
+                assert len(layer_inputs) == 1
+                x = values[layer_inputs[0]]
+            values[layer] = layer.compute(x)
+
+        return values[output_layer]
 
 
 class Layer(nengo.Network):
@@ -253,6 +378,10 @@ class Layer(nengo.Network):
     def shape_out(self):
         return (self.size_out,)
 
+    def input_for(self, i):
+        """Object that the connection from input layer ``i`` targets."""
+        return self.input
+
     def compute(self, x):
         raise NotImplementedError()
 
@@ -267,15 +396,21 @@ class Layer(nengo.Network):
         y = f(x)
         return y
 
-    def _compute_input(self, x):
+    def _save_args(self):
+        """Constructor arguments that recreate this layer when loading."""
+        raise NotImplementedError("Saving %s is not supported"
+                                  % type(self).__name__)
+
+    def _compute_input(self, x, size_in=None):
+        size_in = self.size_in if size_in is None else size_in
         x = np.asarray(x)
         if x.ndim == 0:
             raise ValueError("'x' must be at least 1D")
         elif x.ndim == 1:
-            assert x.shape[0] == self.size_in
+            assert x.shape[0] == size_in
             return x.reshape(1, -1)
 
-        assert x.ndim == 2 and x.shape[1] == self.size_in
+        assert x.ndim == 2 and x.shape[1] == size_in
         return x
 
 
@@ -353,6 +488,12 @@ class NeuronLayer(Layer):
         x = self._compute_input(x)
         return self.amplitude * self.neuron_type.rates(x, self.gain, self.bias)
 
+    def _save_args(self):
+        return dict(n=self.ensemble.n_neurons, neuron_type=self.neuron_type,
+                    synapse=self.synapse, gain=np.array(self.gain),
+                    bias=np.array(self.bias),
+                    amplitude=np.array(self.amplitude))
+
     def theano(self, sx):
         import theano
         import theano.tensor as tt
@@ -367,6 +508,9 @@ class DataLayer(NodeLayer):
     def __init__(self, size, **kwargs):
         super(DataLayer, self).__init__(size_in=size, **kwargs)
 
+    def _save_args(self):
+        return dict(size=self.size_out)
+
     def compute(self, x):
         return x.reshape((x.shape[0], self.size_out))
 
@@ -374,11 +518,48 @@ class DataLayer(NodeLayer):
         return sx.reshape((sx.shape[0], self.size_out))
 
 
+class MergeLayer(NodeLayer):
+    """Layer combining several input layers.
+
+    ``compute`` takes a list with the values of each input layer.
+    """
+
+    def theano(self, sxs):
+        raise NotImplementedError()
+
+
+class SumLayer(MergeLayer):
+    def __init__(self, size, **kwargs):
+        super(SumLayer, self).__init__(size_in=size, **kwargs)
+
+    def compute(self, xs):
+        return sum(self._compute_input(x) for x in xs)
+
+
+class ConcatLayer(MergeLayer):
+    def __init__(self, sizes, **kwargs):
+        self.sizes = tuple(int(size) for size in sizes)
+        super(ConcatLayer, self).__init__(size_in=sum(self.sizes), **kwargs)
+
+    def input_for(self, i):
+        start = sum(self.sizes[:i])
+        return self.input[start:start+self.sizes[i]]
+
+    def compute(self, xs):
+        assert len(xs) == len(self.sizes)
+        xs = [self._compute_input(x, size_in=size)
+              for x, size in zip(xs, self.sizes)]
+        return np.concatenate(xs, axis=1)
+
+
 class SoftmaxLayer(NodeLayer):
     def __init__(self, size, **kwargs):
         super(SoftmaxLayer, self).__init__(
             output=lambda t, x: softmax(x), size_in=size, **kwargs)
 
+    def _save_args(self):
+        return dict(size=self.size_in)
+
     def compute(self, x):
         x = self._compute_input(x)
         return softmax(x, axis=-1)
@@ -398,6 +579,9 @@ class DropoutLayer(NodeLayer):
     def keep(self):
         return self.pre_args['transform']
 
+    def _save_args(self):
+        return dict(size=self.size_in, keep=self.keep)
+
     def compute(self, x):
         x = self._compute_input(x)
         return self.keep * x
@@ -407,31 +591,78 @@ class DropoutLayer(NodeLayer):
 
 
 class FullLayer(NodeLayer):
-    def __init__(self, weights, biases, **kwargs):
+    """Fully connected layer.
+
+    With ``quantize=True``, the weights are stored as int8 with a scale for
+    each output (see `.quantize_int8`), and are applied by the layer's node
+    rather than by a transform on its input connection. ``scales`` can be
+    given instead, for weights that have already been quantized.
+
+    Quantized weights are converted to float32 a block of rows at a time
+    whenever they are used (see `.quantized_dot`), so they take 8x less
+    memory than float64 weights, but applying them is slower (about 2x
+    for large layers).
+    """
+
+    def __init__(self, weights, biases, scales=None, quantize=False,
+                 **kwargs):
         assert weights.ndim == 2
         assert biases.size == weights.shape[0]
-        super(FullLayer, self).__init__(size_in=weights.shape[0], **kwargs)
+        assert scales is None or not quantize
+        if quantize:
+            weights, scales = quantize_int8(weights)
 
         self.weights = np.array(weights)  # copy
         self.biases = np.array(biases)  # copy
+        self.scales = None if scales is None else np.array(scales)  # copy
 
-        with self:
-            self.bias = nengo.Node(output=biases)
-            nengo.Connection(self.bias, self.node, synapse=None)
+        if self.scales is None:
+            super(FullLayer, self).__init__(size_in=weights.shape[0], **kwargs)
 
-        self.pre_args['transform'] = weights
+            with self:
+                self.bias = nengo.Node(output=biases)
+                nengo.Connection(self.bias, self.node, synapse=None)
 
-        if self.label is not None:
-            self.bias.label = '%s_bias' % self.label
+            self.pre_args['transform'] = weights
+
+            if self.label is not None:
+                self.bias.label = '%s_bias' % self.label
+        else:
+            assert self.scales.shape == (weights.shape[0],)
+            super(FullLayer, self).__init__(
+                output=_quantized_full_step(
+                    self.weights, self.scales, self.biases),
+                size_in=weights.shape[1], **kwargs)
+
+    @property
+    def size_in(self):
+        # the input node of a float layer gets the transformed input
+        return self.weights.shape[1]
+
+    def _save_args(self):
+        return dict(weights=self.weights, biases=self.biases,
+                    scales=self.scales)
 
     def compute(self, x):
         x = self._compute_input(x)
-        return np.dot(x, self.weights.T) + self.biases
+        if self.scales is None:
+            return np.dot(x, self.weights.T) + self.biases
+        return self.scales * quantized_dot(x, self.weights) + self.biases
 
     def theano(self, sx):
         import theano.tensor as tt
         assert sx.ndim == 2
-        return tt.dot(sx, self.weights.T) + self.biases
+        weights = (self.weights if self.scales is None else
+                   self.scales[:, None] * self.weights)
+        return tt.dot(sx, weights.T) + self.biases
+
+
+def _quantized_full_step(weights, scales, biases):
+    buffer = quantized_buffer(weights)
+
+    def step_full(t, x):
+        return scales * quantized_dot(x, weights, buffer=buffer) + biases
+    return step_full
 
 
 class ProcessLayer(NodeLayer):
@@ -463,14 +694,20 @@ class ProcessLayer(NodeLayer):
 
 class LocalLayer(ProcessLayer):
     def __init__(self, input_shape, filters, biases,
-                 strides=1, padding=0, **kwargs):
+                 strides=1, padding=0, border='ceil', **kwargs):
         assert filters.ndim == 6
         filters = np.array(filters)  # copy
         biases = np.array(biases)  # copy
         p = Conv2d(input_shape, filters, biases,
-                   strides=strides, padding=padding)
+                   strides=strides, padding=padding, border=border)
         super(LocalLayer, self).__init__(p, **kwargs)
 
+    def _save_args(self):
+        p = self.process
+        return dict(input_shape=p.shape_in, filters=p.filters,
+                    biases=p.biases, strides=p.strides, padding=p.padding,
+                    border=p.border)
+
     def theano(self, x):
         import theano.tensor as tt
 
@@ -504,19 +741,37 @@ class LocalLayer(ProcessLayer):
 
 
 class ConvLayer(ProcessLayer):
-    def __init__(self, input_shape, filters, biases,
-                 strides=1, padding=0, border='ceil', **kwargs):
+    """Convolutional layer.
+
+    ``scales`` and ``quantize`` store the filters as int8, like for
+    `.FullLayer`, with one scale for each filter.
+    """
+
+    def __init__(self, input_shape, filters, biases, strides=1, padding=0,
+                 border='ceil', scales=None, quantize=False, **kwargs):
         assert filters.ndim == 4
+        assert scales is None or not quantize
+        if quantize:
+            filters, scales = quantize_int8(filters)
         filters = np.array(filters)  # copy
         biases = np.array(biases)  # copy
-        p = Conv2d(input_shape, filters, biases,
-                   strides=strides, padding=padding, border=border)
+        scales = None if scales is None else np.array(scales)  # copy
+        p = Conv2d(input_shape, filters, biases, strides=strides,
+                   padding=padding, border=border, scales=scales)
         super(ConvLayer, self).__init__(p, **kwargs)
 
+    def _save_args(self):
+        p = self.process
+        return dict(input_shape=p.shape_in, filters=p.filters,
+                    biases=p.biases, strides=p.strides, padding=p.padding,
+                    border=p.border, scales=p.scales)
+
     def theano(self, x):
         import theano.tensor as tt
 
         filters = self.process.filters
+        if self.process.scales is not None:
+            filters = self.process.scales[:, None, None, None] * filters
         biases = self.process.biases
         nc, nxi, nxj = self.process.shape_in
         nf, nyi, nyj = self.process.shape_out
@@ -553,6 +808,11 @@ class PoolLayer(ProcessLayer):
                    kind=kind, mode=mode)
         super(PoolLayer, self).__init__(p, **kwargs)
 
+    def _save_args(self):
+        p = self.process
+        return dict(input_shape=p.shape_in, pool_size=p.pool_size,
+                    strides=p.strides, kind=p.kind, mode=p.mode)
+
     def theano(self, x):
         import theano.tensor as tt
         import theano.tensor.signal.pool
@@ -624,6 +884,40 @@ def _vectorize(value, n, name):
                          % (name, n, value.size))
 
 
+def _type_path(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def _import_type(path, base):
+    module, _, name = path.rpartition('.')
+    cls = getattr(importlib.import_module(module), name)
+    if not (isinstance(cls, type) and issubclass(cls, base)):
+        raise ValueError("%r is not a valid type here" % path)
+    return cls
+
+
+def _object_spec(obj):
+    """JSON-compatible description of a neuron type or synapse."""
+    if isinstance(obj, nengo.neurons.NeuronType):
+        names = [param.name for param in obj._params]
+    elif isinstance(obj, (nengo.Lowpass, nengo.Alpha)):
+        names = ['tau']
+    elif type(obj) is nengo.LinearFilter:
+        names = ['num', 'den', 'analog']
+    else:
+        raise NotImplementedError("Saving %r is not supported" % obj)
+
+    args = {}
+    for name in names:
+        value = getattr(obj, name)
+        args[name] = value.tolist() if isinstance(value, np.ndarray) else value
+    return dict(type=_type_path(type(obj)), args=args)
+
+
+def _from_object_spec(spec, base):
+    return _import_type(spec['type'], base)(**spec['args'])
+
+
 def neuron_theano(neuron_type, x):
     import theano
     import theano.tensor as tt
@@ -651,3 +945,248 @@ def neuron_theano(neuron_type, x):
         return tt.switch(j > 0, r, 0)
     else:
         raise NotImplementedError("Neuron type %r" % neuron_type)
+
+
+def layer_synapse(synapse, name, depth):
+    """Synapse for a neuron layer, given a per-layer specification.
+
+    Parameters
+    ----------
+    synapse : Synapse, float, None, dict, list, or callable
+        A single synapse (or time constant) is used for all layers. A dict
+        maps layer names, or depths, to synapses; names take precedence, and
+        the ``None`` key (if present) gives the synapse for other layers. A
+        list gives the synapse for each depth. A callable is called as
+        ``synapse(name, depth)``.
+    name : str
+        Name of the neuron layer.
+    depth : int
+        Number of neuron layers before this one in the network.
+    """
+    if isinstance(synapse, dict):
+        return synapse[name] if name in synapse else (
+            synapse[depth] if depth in synapse else synapse.get(None, None))
+    elif isinstance(synapse, (list, tuple)):
+        return synapse[depth]
+    elif callable(synapse) and not isinstance(synapse, nengo.synapses.Synapse):
+        return synapse(name, depth)
+    return synapse
+
+
+def rate_response(net, x, synapse, presentation_time, dt=0.001):
+    """Approximate network outputs over the presentation of each input.
+
+    Neurons are replaced by their rates, filtered by the synapse of each
+    neuron layer, so the result approximates the mean of a spiking network's
+    outputs. Each input is assumed to be presented directly after the
+    previous one (the last for the first input), once the network has
+    settled on the previous input.
+
+    Parameters
+    ----------
+    net : SequentialNetwork
+        The network.
+    x : (n, size_in) array_like
+        Inputs to the network.
+    synapse : see `.layer_synapse`
+        Synapses for the neuron layers (rather than those of the network).
+    presentation_time : float
+        Time for which each input is presented.
+    dt : float, optional
+        Simulation time step.
+
+    Returns
+    -------
+    y : (n_steps, n, size_out) ndarray
+        Network outputs at each time step of the presentation.
+    """
+    n_steps = int(np.round(presentation_time / dt))
+    names = dict((layer, name) for name, layer in net.layers_by_name.items())
+
+    # Start filters from the steady-state outputs for the previous inputs.
+    # Like in a Nengo simulation, filters get their input one step late.
+    y = np.asarray(x)
+    filters = []
+    depth = 0
+    for layer in net.layers:
+        y = layer.compute(y)
+        step = None
+        if isinstance(layer, NeuronLayer):
+            syn = layer_synapse(synapse, names.get(layer, layer.label), depth)
+            syn = nengo.Lowpass(syn) if is_number(syn) else syn
+            if syn is not None:
+                y0 = np.roll(y, 1, axis=0)
+                step = [syn.make_step(y.shape, y.shape, dt, None, y0=y0), y0]
+            depth += 1
+        filters.append(step)
+
+    ys = []
+    for i in range(n_steps):
+        y = np.asarray(x)
+        for layer, step in zip(net.layers, filters):
+            y = layer.compute(y)
+            if step is not None:
+                y, step[1] = step[0]((i + 1) * dt, step[1]), y
+        ys.append(np.array(y))
+
+    return np.array(ys)
+
+
+class SynapseSweep(object):
+    """Classification accuracy over time for several synapse schedules.
+
+    Returned by `.synapse_sweep`.
+
+    Attributes
+    ----------
+    t : (n_steps,) ndarray
+        Time since the start of each presentation.
+    accuracy : OrderedDict
+        Maps each schedule's key to its ``(n_steps,)`` array of accuracies.
+    """
+
+    def __init__(self, t, accuracy):
+        self.t = t
+        self.accuracy = accuracy
+
+    def latency(self, level):
+        """Time for each schedule to first reach accuracy ``level``.
+
+        Schedules that never reach ``level`` have infinite latency.
+        """
+        return collections.OrderedDict(
+            (key, self.t[np.argmax(acc >= level)] if np.any(acc >= level)
+             else np.inf) for key, acc in self.accuracy.items())
+
+    def __str__(self):
+        best = max(acc[-1] for acc in self.accuracy.values())
+        latency = self.latency(0.99 * best)
+        lines = ["%-24s %10s %12s" % ('schedule', 'accuracy', 'latency (s)')]
+        for key, acc in self.accuracy.items():
+            lines.append("%-24s %10.4f %12.4f" % (
+                str(key)[:24], acc[-1], latency[key]))
+        return '\n'.join(lines)
+
+
+def synapse_sweep(net, schedules, x, labels, presentation_time, dt=0.001):
+    """Compare how quickly a network classifies inputs with each synapse
+    schedule.
+
+    Uses the rate-based approximation of `.rate_response`, which is much
+    faster than simulating a spiking network, to find the accuracy at each
+    time after an input is presented.
+
+    Parameters
+    ----------
+    net : SequentialNetwork
+        The network.
+    schedules : dict
+        Maps a key for each schedule to a synapse specification for
+        `.layer_synapse`.
+    x : (n, size_in) array_like
+        Inputs to the network.
+    labels : (n,) array_like
+        Index of the correct output for each input.
+    presentation_time : float
+        Time for which each input is presented.
+    dt : float, optional
+        Simulation time step.
+
+    Returns
+    -------
+    sweep : SynapseSweep
+    """
+    labels = np.asarray(labels)
+    accuracy = collections.OrderedDict()
+    for key, synapse in schedules.items():
+        y = rate_response(net, x, synapse, presentation_time, dt=dt)
+        accuracy[key] = np.mean(np.argmax(y, axis=-1) == labels, axis=-1)
+
+    t = dt * np.arange(1, len(next(iter(accuracy.values()))) + 1)
+    return SynapseSweep(t, accuracy)
+
+
+class QuantizationReport(object):
+    """Differences between a network and a copy with quantized weights.
+
+    Returned by `.compare_quantized`.
+
+    Attributes
+    ----------
+    layers : OrderedDict
+        Maps the name (or index) of each layer to a ``(max_error,
+        rel_error)`` tuple, where ``max_error`` is the largest absolute
+        difference from the activities of the float network, and
+        ``rel_error`` is this relative to the largest float activity.
+    agreement : float
+        Fraction of inputs for which both networks have the same largest
+        output (i.e. the same classification).
+    float_bytes : int
+        Memory used by the weights of the float network.
+    quantized_bytes : int
+        Memory used by the weights (and scales) of the quantized network.
+    """
+
+    def __init__(self):
+        self.layers = collections.OrderedDict()
+        self.agreement = 1.
+        self.float_bytes = 0
+        self.quantized_bytes = 0
+
+    @property
+    def max_rel_error(self):
+        """Largest relative error over all layers."""
+        return max(rel_error for _, rel_error in self.layers.values())
+
+    def __str__(self):
+        lines = ["%-24s %12s %12s" % ('layer', 'max error', 'rel error')]
+        for name, (error, rel_error) in self.layers.items():
+            lines.append("%-24s %12.3e %12.3e" % (name, error, rel_error))
+        lines.append("agreement: %0.4f" % self.agreement)
+        lines.append("weights: %d bytes (float), %d bytes (quantized)"
+                     % (self.float_bytes, self.quantized_bytes))
+        return '\n'.join(lines)
+
+
+def _weight_bytes(layer):
+    if isinstance(layer, FullLayer):
+        arrays = [layer.weights, layer.scales]
+    elif isinstance(layer, (ConvLayer, LocalLayer)):
+        arrays = [layer.process.filters, layer.process.scales]
+    else:
+        arrays = []
+    return sum(a.nbytes for a in arrays if a is not None)
+
+
+def compare_quantized(net, qnet, x):
+    """Compare the activities of a network with those of a quantized copy.
+
+    Parameters
+    ----------
+    net : SequentialNetwork
+        The network with float weights.
+    qnet : SequentialNetwork
+        The same network, with some layers created with ``quantize=True``.
+    x : (n, size_in) array_like
+        Inputs to the networks.
+
+    Returns
+    -------
+    report : QuantizationReport
+    """
+    assert len(net.layers) == len(qnet.layers)
+    names = dict((layer, name) for name, layer in net.layers_by_name.items())
+
+    report = QuantizationReport()
+    y = qy = np.asarray(x)
+    for i, (layer, qlayer) in enumerate(zip(net.layers, qnet.layers)):
+        y, qy = layer.compute(y), qlayer.compute(qy)
+        error = np.abs(qy - y).max()
+        scale = np.abs(y).max()
+        report.layers[names.get(layer, str(i))] = (
+            error, error / scale if scale > 0 else error)
+        report.float_bytes += _weight_bytes(layer)
+        report.quantized_bytes += _weight_bytes(qlayer)
+
+    report.agreement = np.mean(np.argmax(y, axis=1) == np.argmax(qy, axis=1))
+    return report
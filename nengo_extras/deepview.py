@@ -1,12 +1,17 @@
 """
 Tools for visualizing deep neural networks
+
+``PIL.ImageTk`` is only imported once images are first displayed.
 """
 import collections
 
 import numpy as np
-import PIL.ImageTk
+from nengo.utils.compat import PY2
 
-from .compat import tkinter as tk
+if PY2:
+    import Tkinter as tk
+else:
+    import tkinter as tk
 
 
 class ImageSelector(tk.Frame):
@@ -48,6 +53,8 @@ class ImageSelector(tk.Frame):
     def _canvas_resized(self):
         h = self.canvas.winfo_height()
         w = self.canvas.winfo_width()
+        import PIL.ImageTk
+
         image = self.image.resize((w, h), self.resample)
         photo = PIL.ImageTk.PhotoImage(image)
         self.photo = photo
@@ -172,6 +179,8 @@ class VerticalImageFrame(ScrollCanvasFrame):
             self.canvas_images.append(image_row)
 
     def set_images(self, column_images):
+        import PIL.ImageTk
+
         assert len(column_images) == self.n_columns
         n_rows = max(len(images) for images in column_images)
         if n_rows > self.n_rows:
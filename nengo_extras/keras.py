@@ -1,14 +1,25 @@
+"""Conversion of Keras models to Nengo networks.
+
+Keras is only imported when it is first needed (e.g. when a model is
+converted, or `.SoftLIF` is accessed), so that importing this module is fast.
+"""
+
 from __future__ import absolute_import
+import collections
 import os
+import sys
+import timeit
+import warnings
 
-import keras
 import nengo
 import numpy as np
 
 import nengo_extras.deepnetworks
 
 
-class SoftLIF(keras.layers.Layer):
+class _SoftLIF(object):
+    """Keras layer applying the `.SoftLIFRate` nonlinearity."""
+
     def __init__(self, sigma=1., amplitude=1., tau_rc=0.02, tau_ref=0.002,
                  **kwargs):
         self.supports_masking = True
@@ -16,9 +27,32 @@ class SoftLIF(keras.layers.Layer):
         self.amplitude = amplitude
         self.tau_rc = tau_rc
         self.tau_ref = tau_ref
-        super(SoftLIF, self).__init__(**kwargs)
+        super(_SoftLIF, self).__init__(**kwargs)
 
     def call(self, x, mask=None):
+        from keras import backend as K
+        if K.backend() == 'tensorflow':
+            import tensorflow as tf
+
+            @tf.custom_gradient
+            def softlif(x):
+                r, d = self.rates_and_derivative(x)
+                return r, lambda dy: dy * d
+
+            return softlif(x)
+
+        # other backends: forward rates with the analytic gradient attached
+        r, d = self.rates_and_derivative(x)
+        return K.stop_gradient(r) + K.stop_gradient(d) * (
+            x - K.stop_gradient(x))
+
+    def rates_and_derivative(self, x):
+        """Rates and their derivative with respect to ``x``.
+
+        These match `.SoftLIFRate.rates` and `.SoftLIFRate.derivative`, and
+        share the intermediates from a single exponential, which never
+        overflows. For very negative inputs, asymptotic forms are used.
+        """
         from keras import backend as K
         if K.backend() == 'tensorflow':
             import tensorflow as tf
@@ -30,22 +64,42 @@ class SoftLIF(keras.layers.Layer):
             switch = tt.switch
 
         xs = x / self.sigma
+        e = K.exp(-K.abs(xs))
+        ones = K.ones_like(xs)
         x_valid = xs > -20
-        xs_safe = switch(x_valid, xs, K.zeros_like(xs))
-        j = K.softplus(xs_safe) * self.sigma
-        q = switch(x_valid, log1p(1/j), -xs - np.log(self.sigma))
-        return self.amplitude / (self.tau_ref + self.tau_rc*q)
+        j = switch(x_valid, K.relu(x) + self.sigma * log1p(e), ones)
+        s = switch(xs > 0, ones, e) / (1 + e)  # logistic(xs)
+        q = switch(x_valid, log1p(1 / j), -xs - np.log(self.sigma))
+        r = self.amplitude / (self.tau_ref + self.tau_rc * q)
+        sj = switch(x_valid, s / (j * (j + 1)), ones / self.sigma)
+        return r, (self.tau_rc / self.amplitude) * r * r * sj
 
     def get_config(self):
         config = {'sigma': self.sigma, 'amplitude': self.amplitude,
                   'tau_rc': self.tau_rc, 'tau_ref': self.tau_ref}
-        base_config = super(SoftLIF, self).get_config()
+        base_config = super(_SoftLIF, self).get_config()
         return dict(list(base_config.items()) + list(config.items()))
 
 
-_custom_objects = {
-    'SoftLIF': SoftLIF
-}
+def _softlif_type():
+    """The `.SoftLIF` layer class, which is created (importing Keras) on
+    first use."""
+    global SoftLIF
+    if 'SoftLIF' not in globals():
+        import keras
+        SoftLIF = type('SoftLIF', (_SoftLIF, keras.layers.Layer),
+                       {'__doc__': _SoftLIF.__doc__})
+    return SoftLIF
+
+
+def __getattr__(name):
+    if name == 'SoftLIF':
+        return _softlif_type()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+if sys.version_info < (3, 7):  # no module __getattr__, so create it now
+    _softlif_type()
 
 
 def load_model_pair(filepath, custom_objects=None):
@@ -55,7 +109,9 @@ def load_model_pair(filepath, custom_objects=None):
     json_path = filepath + '.json'
     h5_path = filepath + '.h5'
 
-    combined_customs = dict(_custom_objects)
+    import keras
+
+    combined_customs = {'SoftLIF': _softlif_type()}
     combined_customs.update(custom_objects)
 
     with open(json_path, 'r') as f:
@@ -80,46 +136,217 @@ def save_model_pair(model, filepath, overwrite=False):
     model.save_weights(h5_path, overwrite=overwrite)
 
 
+def batchnorm_scale_shift(layer):
+    """Scale and shift equivalent to a BatchNormalization layer at test time.
+
+    The layer computes ``x * scale + shift``, with ``scale`` and ``shift``
+    applying along ``layer.axis``.
+    """
+    weights = list(layer.get_weights())
+    gamma = weights.pop(0) if layer.scale else 1.
+    beta = weights.pop(0) if layer.center else 0.
+    mean, variance = weights
+    scale = gamma / np.sqrt(variance + layer.epsilon)
+    return scale, beta - mean * scale
+
+
+def channels_first_shape(shape, data_format):
+    """Spatial shape ``shape`` in ``(channels, rows, cols)`` order."""
+    if data_format == 'channels_last':
+        return (shape[2], shape[0], shape[1])
+    elif data_format == 'channels_first':
+        return tuple(shape)
+
+    raise ValueError("Unrecognized data format %r" % data_format)
+
+
 def kmodel_compute_shapes(kmodel, input_shape):
-    assert isinstance(kmodel, keras.models.Sequential)
+    """Output shapes of each layer of a model, given the input shape.
+
+    Returns a list starting with ``input_shape``, followed by the output
+    shape of each layer in ``kmodel.layers`` (other than input layers).
+    Functional models must have a single input.
+    """
+    import keras
 
+    if isinstance(kmodel, keras.models.Sequential):
+        shapes = [input_shape]
+        for layer in kmodel.layers:
+            s = layer.compute_output_shape(shapes[-1])
+            shapes.append(s)
+
+        return shapes
+
+    assert isinstance(kmodel, keras.models.Model)
+    assert len(kmodel.inputs) == 1, "Model must have a single input"
+    input_layer = kmodel.inputs[0]._keras_history[0]
+    layer_shapes = {input_layer.name: input_shape}
     shapes = [input_shape]
     for layer in kmodel.layers:
-        s = layer.compute_output_shape(shapes[-1])
+        if layer is input_layer:
+            continue
+        in_shapes = [layer_shapes[i.name] for i in _inbound_layers(layer)]
+        s = layer.compute_output_shape(
+            in_shapes[0] if len(in_shapes) == 1 else in_shapes)
+        layer_shapes[layer.name] = s
         shapes.append(s)
 
     return shapes
 
 
-class SequentialNetwork(nengo_extras.deepnetworks.SequentialNetwork):
+def _as_list(x):
+    return x if isinstance(x, list) else [x]
 
-    def __init__(self, model, synapse=None, lif_type='lif', **kwargs):
-        super(SequentialNetwork, self).__init__(**kwargs)
 
-        assert isinstance(model, keras.models.Sequential)
+def _inbound_layers(layer):
+    nodes = layer._inbound_nodes
+    if len(nodes) != 1:
+        raise NotImplementedError(
+            "Layer %r is called %d times; shared layers are not supported"
+            % (layer.name, len(nodes)))
+    return list(nodes[0].inbound_layers)
+
+
+class _KerasConverter(object):
+    """Builds the Nengo layers of a network from the layers of a Keras model.
+    """
+
+    @property
+    def spatial_layers(self):
+        import keras
+        return (keras.layers.Convolution2D,
+                keras.layers.LocallyConnected2D,
+                keras.layers.AveragePooling2D,
+                keras.layers.MaxPooling2D)
+
+    def _convert(self, model, synapse, lif_type, quantize):
         self.model = model
         self.synapse = synapse
         self.lif_type = lif_type
+        self.quantize = quantize
 
-        # -- build model
-        self.add_data_layer(np.prod(model.input_shape[1:]))
+        # Keras layers feeding only a single other layer can absorb it
+        input_layers = [t._keras_history[0] for t in model.inputs]
+        consumers = collections.defaultdict(list)
         for layer in model.layers:
-            self._add_layer(layer)
+            if layer not in input_layers:
+                for i in self._inbound_layers(layer):
+                    consumers[i.name].append(layer)
+        self._following = dict((name, layers[0]) for name, layers
+                               in consumers.items() if len(layers) == 1)
+        self._folded = set()  # batch normalization layers already applied
+
+        # Map the name of each Keras layer to the Nengo layer computing its
+        # output, the data format of its output, and (for flattened outputs)
+        # the order of its output elements in the network
+        self._outputs = {}
+        self._layouts = {}
+        self._perms = {}
+
+        spatial = [layer for layer in model.layers
+                   if isinstance(layer, self.spatial_layers)]
+        input_layout = None
+        if len(spatial) > 0 and any(len(layer.output_shape) == 4
+                                    for layer in input_layers):
+            input_layout = spatial[0].data_format
+        self.input_channels_last = input_layout == 'channels_last'
+        self.channels_last = set()  # names of layers with permuted outputs
+
+        for layer in input_layers:
+            self._outputs[layer.name] = self._add_input_layer(layer)
+            if len(layer.output_shape) == 4:
+                self._layouts[layer.name] = input_layout
+                if input_layout == 'channels_last':
+                    self.channels_last.add(layer.name)
+
+        for layer in model.layers:
+            if layer not in input_layers:
+                self._add_layer(layer)
+
+    def keras_to_network(self, x, name=None):
+        """Reorder Keras activities into the order used by this network.
+
+        Parameters
+        ----------
+        x : (n, ...) array_like
+            Inputs to the Keras model, or outputs of its layer ``name``.
+        name : str, optional
+            Name of the layer that produced ``x``. If None, ``x`` is
+            treated as model inputs.
+
+        Returns
+        -------
+        y : (n, size) ndarray
+            Flattened activities, transposed to ``channels_first`` order
+            if required.
+        """
+        x = np.asarray(x)
+        if (self.input_channels_last if name is None else
+                name in self.channels_last):
+            x = np.moveaxis(x, -1, 1)
+        return x.reshape(x.shape[0], -1)
+
+    def _inbound_layers(self, layer):
+        return _inbound_layers(layer)
+
+    def _neuron_synapse(self, name):
+        depth = sum(isinstance(layer, nengo_extras.deepnetworks.NeuronLayer)
+                    for layer in self.layers)
+        return nengo_extras.deepnetworks.layer_synapse(
+            self.synapse, name, depth)
+
+    def _quantize(self, name):
+        return (self.quantize if isinstance(self.quantize, bool) else
+                name in self.quantize)
+
+    def _inputs(self, layer):
+        return [self._outputs[i.name] for i in self._inbound_layers(layer)]
+
+    def _input_layout(self, layer):
+        return self._layouts.get(self._inbound_layers(layer)[0].name, None)
 
     def _add_layer(self, layer):
-        assert layer.input_mask is None
-        assert layer.input_shape[0] is None
+        import keras
+
+        assert all(mask is None for mask in _as_list(layer.input_mask))
+        assert all(shape[0] is None for shape in _as_list(layer.input_shape))
+        inbound = self._inbound_layers(layer)
+
+        nlayer = self._dispatch_layer(layer)
+        self._outputs[layer.name] = (
+            nlayer if nlayer is not None else self._outputs[inbound[0].name])
+
+        if isinstance(layer, self.spatial_layers):
+            self._layouts[layer.name] = layer.data_format
+        elif len(layer.output_shape) == 4:
+            self._layouts[layer.name] = self._input_layout(layer)
+
+        if len(inbound) == 1 and not isinstance(
+                layer, (keras.layers.Dense, keras.layers.Flatten)):
+            self._perms[layer.name] = self._perms.get(inbound[0].name, None)
+
+        layout = self._layouts.get(layer.name, None)
+        if nlayer is not None and layout == 'channels_last':
+            self.channels_last.add(layer.name)
+        return nlayer
+
+    def _dispatch_layer(self, layer):
+        import keras
 
         layer_adder = {
             keras.layers.Activation: self._add_activation_layer,
+            keras.layers.Add: self._add_add_layer,
+            keras.layers.BatchNormalization: self._add_batchnorm_layer,
+            keras.layers.Concatenate: self._add_concatenate_layer,
             keras.layers.Dense: self._add_dense_layer,
             keras.layers.Dropout: self._add_dropout_layer,
             keras.layers.Flatten: self._add_flatten_layer,
             keras.layers.Convolution2D: self._add_conv2d_layer,
+            keras.layers.LocallyConnected2D: self._add_local2d_layer,
             keras.layers.AveragePooling2D: self._add_avgpool2d_layer,
             keras.layers.MaxPooling2D: self._add_maxpool2d_layer,
             keras.layers.noise.GaussianNoise: self._add_gaussian_noise_layer,
-            SoftLIF: self._add_softlif_layer,
+            _softlif_type(): self._add_softlif_layer,
         }
 
         for cls in type(layer).__mro__:
@@ -129,17 +356,63 @@ class SequentialNetwork(nengo_extras.deepnetworks.SequentialNetwork):
         raise NotImplementedError("Cannot build layer type %r" %
                                   type(layer).__name__)
 
+    def _layer_weights(self, layer, channel_axis, weights=None):
+        """Weights and biases of a layer, with any following batch
+        normalization folded in.
+
+        ``channel_axis`` is the axis of the layer's output that its last
+        weight axis (and its biases) correspond to. ``weights`` defaults to
+        ``layer.get_weights()``.
+        """
+        import keras
+
+        weights = layer.get_weights() if weights is None else weights
+        W = weights[0]
+        b = (weights[1] if len(weights) > 1 else
+             np.zeros(W.shape[-1], dtype=W.dtype))
+
+        # the normalization can only be folded in before a nonlinearity
+        bn = self._following.get(layer.name, None)
+        if isinstance(bn, keras.layers.BatchNormalization) and (
+                layer.activation is keras.activations.linear):
+            ndim = len(layer.output_shape)
+            if bn.axis % ndim == channel_axis % ndim:
+                scale, shift = batchnorm_scale_shift(bn)
+                W = W * scale
+                b = b * scale + shift
+                self._folded.add(bn.name)
+
+        return W, b
+
+    def _add_batchnorm_layer(self, layer):
+        if layer.name in self._folded:
+            return None  # folded into the weights of the previous layer
+
+        raise NotImplementedError(
+            "BatchNormalization layers are only supported directly after a "
+            "Dense, Conv2D or LocallyConnected2D layer with a linear "
+            "activation, normalizing over its channels")
+
     def _add_dense_layer(self, layer):
-        weights, biases = layer.get_weights()
-        return self.add_full_layer(weights.T, biases, name=layer.name)
+        weights, biases = self._layer_weights(layer, channel_axis=-1)
+        perm = self._perms.get(self._inbound_layers(layer)[0].name, None)
+        if perm is not None:
+            # permute rows to take flattened inputs in network order
+            weights = weights[np.argsort(perm)]
+        return self.add_full_layer(
+            weights.T, biases, quantize=self._quantize(layer.name),
+            inputs=self._inputs(layer), name=layer.name)
 
     def _add_conv2d_layer(self, layer):
         import keras.backend as K
-        shape_in = layer.input_shape[1:]
-        filters, biases = layer.get_weights()
+        shape_in = channels_first_shape(
+            layer.input_shape[1:], layer.data_format)
+        filters, biases = self._layer_weights(
+            layer, channel_axis=(1 if layer.data_format == 'channels_first'
+                                 else -1))
         strides = layer.strides
 
-        assert layer.data_format == 'channels_first'
+        # Keras kernels are (rows, cols, channels, filters) for both formats
         nc, _, _ = shape_in
         filters = np.transpose(filters, (3, 2, 0, 1))
         if K.backend() == 'theano':
@@ -152,22 +425,62 @@ class SequentialNetwork(nengo_extras.deepnetworks.SequentialNetwork):
         if layer.padding == 'valid':
             padding = (0, 0)
         elif layer.padding == 'same':
-            padding = ((si - 1) / 2, (sj - 1) / 2)
+            padding = ((si - 1) // 2, (sj - 1) // 2)
         else:
             raise ValueError("Unrecognized padding %r" % layer.padding)
 
         conv = self.add_conv_layer(
             shape_in, filters, biases, strides=strides, padding=padding,
-            border='floor', name=layer.name)
+            border='floor', quantize=self._quantize(layer.name),
+            inputs=self._inputs(layer), name=layer.name)
         assert conv.size_out == np.prod(layer.output_shape[1:])
         return conv
 
+    def _add_local2d_layer(self, layer):
+        shape_in = channels_first_shape(
+            layer.input_shape[1:], layer.data_format)
+        channels_first = layer.data_format == 'channels_first'
+        assert layer.padding == 'valid'
+
+        nc, _, _ = shape_in
+        nyi, nyj = layer.output_row, layer.output_col
+        si, sj = layer.kernel_size
+        nf = layer.filters
+
+        # Keras reshapes (rather than transposes) the (rows, cols, filters)
+        # biases for `channels_first`, so put them in true order first
+        weights = layer.get_weights()
+        if channels_first and len(weights) > 1:
+            weights[1] = np.transpose(
+                weights[1].reshape((nf, nyi, nyj)), (1, 2, 0))
+        kernel, biases = self._layer_weights(
+            layer, channel_axis=1 if channels_first else -1, weights=weights)
+        biases = np.transpose(
+            np.broadcast_to(biases, (nyi, nyj, nf)), (2, 0, 1))
+
+        # kernel is (output positions, input patch, filters), where the patch
+        # is flattened in the order of the layer's data format
+        if channels_first:
+            filters = kernel.reshape((nyi, nyj, nc, si, sj, nf))
+            filters = np.transpose(filters, (5, 0, 1, 2, 3, 4))
+        else:
+            filters = kernel.reshape((nyi, nyj, si, sj, nc, nf))
+            filters = np.transpose(filters, (5, 0, 1, 4, 2, 3))
+
+        local = self.add_local_layer(
+            shape_in, filters, biases, strides=layer.strides, border='floor',
+            inputs=self._inputs(layer), name=layer.name)
+        assert local.size_out == np.prod(layer.output_shape[1:])
+        return local
+
     def _add_pool2d_layer(self, layer, kind=None):
-        shape_in = layer.input_shape[1:]
+        shape_in = channels_first_shape(
+            layer.input_shape[1:], layer.data_format)
         pool_size = layer.pool_size
         strides = layer.strides
-        return self.add_pool_layer(shape_in, pool_size, strides=strides,
-                                   kind=kind, mode='valid', name=layer.name)
+        return self.add_pool_layer(
+            shape_in, pool_size, strides=strides, kind=kind, mode='valid',
+            inputs=self._inputs(layer), name=layer.name)
 
     def _add_avgpool2d_layer(self, layer):
         return self._add_pool2d_layer(layer, kind='avg')
@@ -176,6 +489,8 @@ class SequentialNetwork(nengo_extras.deepnetworks.SequentialNetwork):
         return self._add_pool2d_layer(layer, kind='max')
 
     def _add_activation_layer(self, layer):
+        import keras
+
         if layer.activation is keras.activations.softmax:
             return self._add_softmax_layer(layer)
 
@@ -190,9 +505,10 @@ class SequentialNetwork(nengo_extras.deepnetworks.SequentialNetwork):
                              % layer.activation)
 
         n = np.prod(layer.input_shape[1:])
+        synapse = self._neuron_synapse(layer.name)
         return self.add_neuron_layer(
-            n, neuron_type=neuron_type, synapse=self.synapse,
-            gain=1, bias=0, name=layer.name)
+            n, neuron_type=neuron_type, synapse=synapse,
+            gain=1, bias=0, inputs=self._inputs(layer), name=layer.name)
 
     def _add_softlif_layer(self, layer):
         from .neurons import SoftLIFRate
@@ -209,9 +525,11 @@ class SequentialNetwork(nengo_extras.deepnetworks.SequentialNetwork):
             raise KeyError("Unrecognized LIF type %r" % self.lif_type)
 
         n = np.prod(layer.input_shape[1:])
+        synapse = self._neuron_synapse(layer.name)
         return self.add_neuron_layer(
-            n, neuron_type=neuron_type, synapse=self.synapse,
-            gain=1, bias=1, amplitude=layer.amplitude, name=layer.name)
+            n, neuron_type=neuron_type, synapse=synapse,
+            gain=1, bias=1, amplitude=layer.amplitude,
+            inputs=self._inputs(layer), name=layer.name)
 
     def _add_softmax_layer(self, layer):
         return None  # non-neural, we can do without it
@@ -222,68 +540,315 @@ class SequentialNetwork(nengo_extras.deepnetworks.SequentialNetwork):
         return None  # keras scales by dropout rate, so we don't have to
 
     def _add_flatten_layer(self, layer):
-        return None  # no computation, just reshaping, so ignore
+        # no computation, just reshaping, but if the flattened order differs
+        # from the network's, the next Dense layer's weights are permuted
+        layout = self._input_layout(layer)
+        if layout is not None and len(layer.input_shape) == 4:
+            shape = channels_first_shape(layer.input_shape[1:], layout)
+            inds = np.arange(np.prod(shape)).reshape(shape)
+            if layout == 'channels_last':
+                inds = np.transpose(inds, (1, 2, 0))
+            if getattr(layer, 'data_format', None) == 'channels_first':
+                inds = np.moveaxis(inds, 0, -1)  # Keras moves channels last
+            perm = inds.ravel()
+            if np.any(perm != np.arange(perm.size)):
+                self._perms[layer.name] = perm
+        return None
+
+    def _check_merge_inputs(self, layer):
+        inbound = self._inbound_layers(layer)
+        if any(self._perms.get(i.name, None) is not None for i in inbound):
+            raise NotImplementedError(
+                "Cannot merge flattened outputs of layers with different "
+                "data formats (in %r)" % layer.name)
+        if len(set(self._layouts.get(i.name, None) for i in inbound)) > 1:
+            raise NotImplementedError(
+                "Cannot merge outputs with different data formats (in %r)"
+                % layer.name)
+
+    def _add_add_layer(self, layer):
+        self._check_merge_inputs(layer)
+        return self.add_sum_layer(
+            np.prod(layer.output_shape[1:]), inputs=self._inputs(layer),
+            name=layer.name)
+
+    def _add_concatenate_layer(self, layer):
+        # Concatenating along the first axis in network order (channels, for
+        # spatial activities) just stacks the flattened inputs
+        self._check_merge_inputs(layer)
+        ndim = len(layer.output_shape)
+        first_axis = (ndim - 1 if self._input_layout(layer) == 'channels_last'
+                      else 1)
+        if layer.axis % ndim != first_axis:
+            raise NotImplementedError(
+                "Concatenate layers are only supported along the channel axis"
+                " (in %r)" % layer.name)
+
+        sizes = [np.prod(shape[1:]) for shape in layer.input_shape]
+        return self.add_concat_layer(
+            sizes, inputs=self._inputs(layer), name=layer.name)
 
     def _add_gaussian_noise_layer(self, layer):
         return None  # no noise during testing
 
 
-def LSUVinit(kmodel, X, tol=0.1, t_max=50):
+class SequentialNetwork(
+        _KerasConverter, nengo_extras.deepnetworks.SequentialNetwork):
+    """Nengo network built from a Keras ``Sequential`` model.
+
+    Spatial activities are always represented in ``channels_first`` order
+    within the network. Layers of ``channels_last`` models have their weights
+    permuted once when the network is built, so that no transposes are needed
+    while simulating. Inputs to such a model must be transposed before being
+    presented to the network; `.keras_to_network` does this.
+
+    ``synapse`` can be a single synapse for all neuron layers, or give a
+    synapse for each layer by name or depth (see `.layer_synapse`).
+
+    ``quantize`` stores the weights of all ``Dense`` and ``Conv2D`` layers
+    as int8 (if True), or of those whose names it contains (see
+    `.FullLayer`, and `.compare_quantized` to check the accuracy).
+    """
+
+    def __init__(self, model, synapse=None, lif_type='lif', quantize=False,
+                 **kwargs):
+        super(SequentialNetwork, self).__init__(**kwargs)
+
+        import keras
+        assert isinstance(model, keras.models.Sequential)
+        previous = [model.inputs[0]._keras_history[0]] + model.layers[:-1]
+        self._previous = dict(
+            (layer.name, prev) for layer, prev in zip(model.layers, previous))
+        self._convert(model, synapse, lif_type, quantize)
+
+    def _inbound_layers(self, layer):
+        return [self._previous[layer.name]]
+
+    def _add_input_layer(self, layer):
+        return self.add_data_layer(np.prod(layer.output_shape[1:]))
+
+
+class TreeNetwork(_KerasConverter, nengo_extras.deepnetworks.TreeNetwork):
+    """Nengo network built from a functional Keras ``Model``.
+
+    Supports branching models with ``Add`` and ``Concatenate`` layers (such
+    as residual networks). Each layer is built once, and its output connected
+    to every layer that uses it. Each model input becomes a named input, and
+    each model output a named output, of the network.
+
+    Spatial activities are always represented in ``channels_first`` order
+    within the network. See `.SequentialNetwork` for ``synapse`` and
+    ``quantize``.
+    """
+
+    def __init__(self, model, synapse=None, lif_type='lif', quantize=False,
+                 **kwargs):
+        super(TreeNetwork, self).__init__(**kwargs)
+
+        import keras
+        assert isinstance(model, keras.models.Model)
+        self._convert(model, synapse, lif_type, quantize)
+        for t in model.outputs:
+            name = t._keras_history[0].name
+            self.add_named_output(name, self._outputs[name])
+
+    def _add_input_layer(self, layer):
+        return self.add_named_input(
+            layer.name, np.prod(layer.output_shape[1:]))
+
+
+class ConversionReport(object):
+    """Differences and timings between a Keras model and its conversion.
+
+    Returned by `.verify_conversion`.
+
+    Attributes
+    ----------
+    layers : OrderedDict
+        Maps the name of each compared layer to a ``(max_error, seconds)``
+        tuple, where ``max_error`` is the largest absolute difference from
+        the Keras activities, and ``seconds`` the time taken by the layer's
+        ``compute``.
+    n_examples : int
+        Number of examples compared.
+    keras_time : float
+        Total time spent in Keras ``predict``.
+    network_time : float
+        Total time spent computing the network (including uncompared layers,
+        such as the data layer).
+    """
+
+    def __init__(self):
+        self.layers = collections.OrderedDict()
+        self.n_examples = 0
+        self.keras_time = 0.
+        self.network_time = 0.
+
+    @property
+    def max_error(self):
+        """Largest error over all compared layers."""
+        return max(error for error, _ in self.layers.values())
+
+    def add(self, name, error, seconds):
+        max_error, total_seconds = self.layers.get(name, (0., 0.))
+        self.layers[name] = (max(max_error, error), total_seconds + seconds)
+
+    def __str__(self):
+        lines = ["%-24s %12s %10s" % ('layer', 'max error', 'time (s)')]
+        for name, (error, seconds) in self.layers.items():
+            lines.append("%-24s %12.3e %10.3f" % (name, error, seconds))
+        lines.append("%-24s %12s %10.3f" % ('network', '', self.network_time))
+        lines.append("%-24s %12s %10.3f" % ('keras', '', self.keras_time))
+        return '\n'.join(lines)
+
+
+def verify_conversion(kmodel, net, X, batch_size=100):
+    """Compare the activities of a converted network with its Keras model.
+
+    Batches of ``X`` are run through both ``kmodel.predict`` and the
+    network's ``compute``, and the outputs of each network layer are compared
+    with those of the Keras layer of the same name (or of the normalization
+    folded into it).
+
+    Parameters
+    ----------
+    kmodel : keras.models.Sequential
+        The Keras model.
+    net : SequentialNetwork
+        The network built from ``kmodel``.
+    X : (n, ...) array_like
+        Inputs to the Keras model.
+    batch_size : int, optional
+        Number of examples to compute at once.
+
+    Returns
+    -------
+    report : ConversionReport
+    """
+    import keras
+
+    targets = collections.OrderedDict()
+    for klayer in kmodel.layers:
+        if klayer.name in net.layers_by_name:
+            following = net._following.get(klayer.name, None)
+            folded = following is not None and following.name in net._folded
+            targets[klayer.name] = following if folded else klayer
+
+    kpart = keras.models.Model(
+        kmodel.inputs, [klayer.output for klayer in targets.values()])
+    names = dict((layer, name) for name, layer in net.layers_by_name.items())
+
+    report = ConversionReport()
+    for i in range(0, len(X), batch_size):
+        xi = X[i:i+batch_size]
+
+        t0 = timeit.default_timer()
+        kys = kpart.predict(xi, batch_size=len(xi))
+        report.keras_time += timeit.default_timer() - t0
+        kys = kys if isinstance(kys, list) else [kys]
+
+        y = net.keras_to_network(xi)
+        ys = {}
+        for layer in net.layers:
+            t0 = timeit.default_timer()
+            y = layer.compute(y)
+            seconds = timeit.default_timer() - t0
+            report.network_time += seconds
+            if layer in names:
+                ys[names[layer]] = (y, seconds)
+
+        for name, ky in zip(targets, kys):
+            y, seconds = ys[name]
+            error = np.abs(y - net.keras_to_network(ky, name=name)).max()
+            report.add(name, error, seconds)
+
+        report.n_examples += len(xi)
+
+    return report
+
+
+def LSUVinit(kmodel, X, tol=0.1, t_max=50, n_samples=1000, rng=np.random):
     """Layer-sequential unit-variance initialization.
 
+    Orthogonalizes the weights of each Dense, Conv2D and LocallyConnected2D
+    layer in turn, then scales them until the layer's outputs on ``X`` have
+    unit variance. Each layer's outputs are computed from the cached outputs
+    of the previously initialized layer, so every iteration only passes
+    through the layers since then.
+
+    Parameters
+    ----------
+    kmodel : keras.models.Sequential
+        The model to initialize (modified in place).
+    X : (n, ...) array_like
+        Inputs to the model.
+    tol : float, optional
+        Tolerance on the output standard deviation.
+    t_max : int, optional
+        Maximum number of iterations per layer.
+    n_samples : int, optional
+        Number of inputs randomly chosen from ``X`` to use (all if None).
+        Defaults to 1000.
+    rng : `numpy.random.RandomState`, optional
+        Random number generator for choosing inputs.
+
+    Returns
+    -------
+    report : OrderedDict
+        Maps the name of each initialized layer to a ``(iterations, std)``
+        tuple, with the number of iterations (layer passes) used and the
+        final standard deviation of the layer's outputs.
+
     References
     ----------
     .. [1] Mishkin, D., & Matas, J. (2016). All you need is a good init.
        In ICLR 2016 (pp. 1-13).
     """
-    from keras.layers import Convolution2D, LocallyConnected2D
+    from keras.layers import Convolution2D, Dense, LocallyConnected2D
     import keras.backend as K
-    # f = K.function([kmodel.layers[0].input, K.learning_phase()],
-    #                [klayer.output])
+    learning_phase = 0  # 0 == testing, 1 == training
 
-    # --- orthogonalize weights
     def orthogonalize(X):
         assert X.ndim == 2
         U, s, V = np.linalg.svd(X, full_matrices=False)
         return np.dot(U, V)
 
+    X = np.asarray(X)
+    if n_samples is not None and len(X) > n_samples:
+        X = X[rng.choice(len(X), size=n_samples, replace=False)]
+
+    report = collections.OrderedDict()
+    x = kmodel.layers[0].input
+    Y = X  # values of `x`, the output of the last initialized layer
     for layer in kmodel.layers:
-        weights = layer.get_weights()
-        if len(weights) == 0:
+        if not isinstance(layer, (Convolution2D, Dense, LocallyConnected2D)):
             continue
 
-        W, b = weights
-        if isinstance(layer, Convolution2D):
-            Wv = W.reshape(W.shape[0], -1)
-        elif isinstance(layer, LocallyConnected2D):
-            Wv = W.reshape(-1, W.shape[-1])
-        else:
-            assert W.ndim == 2
-            Wv = W
-
-        Wv[:] = orthogonalize(Wv)
-        layer.set_weights((W, b))
+        f = K.function([x, K.learning_phase()], [layer.output])
 
-    # --- adjust variances
-    s_input = kmodel.layers[0].input
-    for layer in kmodel.layers:
+        # --- orthogonalize weights (last axis is always the output units)
         weights = layer.get_weights()
-        if len(weights) == 0:
-            continue
-
-        W, b = weights
-        f = K.function([s_input, K.learning_phase()], [layer.output])
-        learning_phase = 0  # 0 == testing, 1 == training
+        W = weights[0]
+        Wv = W.reshape(-1, W.shape[-1])
+        Wv[:] = orthogonalize(Wv)
+        layer.set_weights(weights)
 
+        # --- adjust variance
         for i in range(t_max):
-            Y = f([X, learning_phase])[0]
-            Ystd = Y.std()
-            print(Ystd)
-            if abs(Ystd - 1) < tol:
+            Z = f([Y, learning_phase])[0]
+            Zstd = Z.std()
+            if abs(Zstd - 1) < tol:
                 break
 
-            W /= Ystd
-            layer.set_weights((W, b))
+            W /= Zstd
+            layer.set_weights(weights)
         else:
-            print("Layer %r did not converge after %d iterations (Ystd=%0.3e)"
-                  % (layer.name, t_max, Ystd))
+            Z = f([Y, learning_phase])[0]
+            Zstd = Z.std()
+            warnings.warn("Layer %r did not converge after %d iterations "
+                          "(Ystd=%0.3e)" % (layer.name, t_max, Zstd))
+
+        report[layer.name] = (i + 1, Zstd)
+        x, Y = layer.output, Z
+
+    return report
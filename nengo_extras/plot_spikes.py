@@ -16,10 +16,11 @@ to the data.
 
 from __future__ import absolute_import
 
-import matplotlib
-import matplotlib.pyplot as plt
+import matplotlib.colors
 import numpy as np
 
+from .neurons import SpikeEvents
+
 
 cm_gray_r_a = matplotlib.colors.LinearSegmentedColormap.from_list(
     'gray_r_a', [(0., 0., 0., 0.), (0., 0., 0., 1.)])
@@ -60,6 +61,7 @@ def plot_spikes(t, spikes, contrast_scale=1.0, ax=None, **kwargs):
     t = np.asarray(t)
     spikes = np.asarray(spikes)
     if ax is None:
+        import matplotlib.pyplot as plt
         ax = plt.gca()
 
     kwargs.setdefault('aspect', 'auto')
@@ -143,6 +145,28 @@ def cluster(t, spikes, filter_width):
 
 
 def merge(t, spikes, num):
+    """Merges spike trains into a smaller number of averaged spike trains.
+
+    Parameters
+    ----------
+    t : (n,) array
+        Time indices of *spike* matrix. The indices are assumed to be
+        equidistant.
+    spikes : (n, m) array or SpikeEvents
+        Spike data for *m* neurons at *n* time points.
+    num : int
+        Number of spike trains to return. Consecutive blocks of spike trains
+        are averaged to obtain each of them.
+
+    Returns
+    -------
+    tuple (t, merged_spikes)
+        Returns the time indices *t* and the merged spike trains *spikes*.
+        If *spikes* is a `.SpikeEvents`, so is *merged_spikes*.
+    """
+    if isinstance(spikes, SpikeEvents):
+        return t, _merge_events(spikes, num)
+
     spikes = np.asarray(spikes)
 
     if spikes.shape[1] <= num:
@@ -155,6 +179,25 @@ def merge(t, spikes, num):
     return t, merged
 
 
+def _merge_events(events, num):
+    n = events.n_neurons
+    if n <= num:
+        return events
+
+    blocksize = int(np.ceil(float(n) / num))
+    block_sizes = np.bincount(np.arange(n) // blocksize, minlength=num)
+    blocks = events.neurons // blocksize
+
+    # order events by block, then by time within each block
+    order = np.lexsort((events.indices, blocks))
+    blocks = blocks[order]
+    values = events.event_values()[order] / block_sizes[blocks]
+
+    offsets = np.zeros(num + 1, dtype=events.offsets.dtype)
+    np.cumsum(np.bincount(blocks, minlength=num), out=offsets[1:])
+    return SpikeEvents(events.t, events.indices[order], offsets, values=values)
+
+
 def sample_by_variance(t, spikes, num, filter_width):
     """Samples the spike trains with the highest variance.
 
@@ -195,7 +238,7 @@ def sample_by_activity(t, spikes, num, blocksize=None):
     t : (n,) array
         Time indices of *spike* matrix. The indices are assumed to be
         equidistant.
-    spikes : (n, m) array
+    spikes : (n, m) array or SpikeEvents
         Spike data for *m* neurons at *n* time points.
     num : int
         Number of spike trains to return.
@@ -208,22 +251,27 @@ def sample_by_activity(t, spikes, num, blocksize=None):
     -------
     tuple (t, selected_spikes)
         Returns the time indices *t* and the selected spike trains *spikes*.
+        If *spikes* is a `.SpikeEvents`, so is *selected_spikes*.
     """
-    spikes = np.asarray(spikes)
+    events = isinstance(spikes, SpikeEvents)
+    if not events:
+        spikes = np.asarray(spikes)
 
-    if spikes.shape[1] <= num:
+    n = spikes.n_neurons if events else spikes.shape[1]
+    if n <= num:
         return t, spikes
 
     if blocksize is None:
-        blocksize = spikes.shape[1]
+        blocksize = n
 
-    selected = np.empty((len(t), num))
-    n_blocks = int(np.ceil(float(spikes.shape[1]) / blocksize))
+    activity = spikes.sum() if events else np.sum(spikes, axis=0)
+    n_blocks = int(np.ceil(float(n) / blocksize))
     n_sel = int(np.ceil(float(num) / n_blocks))
+    selected = []
     for i in range(n_blocks):
-        block = spikes[:, (i * blocksize):((i + 1) * blocksize)]
-        activity = np.sum(block, axis=0)
-        selected[:, (i * n_sel):((i + 1) * n_sel)] = (
-            block[:, np.argsort(activity)[-1:(-n_sel - 1):-1]])
+        block = activity[(i * blocksize):((i + 1) * blocksize)]
+        selected.append(
+            i * blocksize + np.argsort(block)[-1:(-n_sel - 1):-1])
+    selected = np.concatenate(selected)[:num]
 
-    return t, selected
+    return t, spikes[selected] if events else spikes[:, selected]
@@ -0,0 +1,300 @@
+"""Timing benchmarks.
+
+These are slow tests that do not make assertions; they only run when
+requested with ``--slow --analytics``, and save their timings as analytics
+data so that two runs can be compared with ``--compare``. The comparisons
+fail if the second run is more than ``max_slowdown`` times slower.
+"""
+
+import os
+import timeit
+
+import nengo
+import numpy as np
+import pytest
+
+import nengo_extras.data
+from nengo_extras.data import (
+    load_cifar10, load_ilsvrc2012, load_mnist, load_stats, load_svhn)
+from nengo_extras.neurons import (
+    FastLIF, IntegerLIF, SoftLIFRate, rates_isi, rates_kernel)
+from nengo_extras.tests.test_data import (
+    write_cifar10_tar_gz, write_ilsvrc2012_tar_gz, write_mnist_pkl_gz,
+    write_svhn_tar_gz)
+from nengo_extras.tests.test_imports import import_budget, import_module
+
+# Largest ratio of second to first run times accepted by the comparisons,
+# unless the difference is below `min_slowdown` seconds (i.e. noise)
+max_slowdown = 1.5
+min_slowdown = 0.01
+
+
+def time_call(f, repeat=5, number=1):
+    """Minimum time in seconds taken by ``number`` calls to ``f``"""
+    return min(timeit.repeat(f, repeat=repeat, number=number)) / number
+
+
+def compare_times(name, t1, t2, logger):
+    """Log the ratio of run times ``t2 / t1``, and check for a slowdown
+
+    For arrays of times, the median ratio is used.
+    """
+    t1, t2 = np.asarray(t1), np.asarray(t2)
+    ratio = np.median(t2 / t1)
+    logger.info("%s: %0.2fx the time of the first run", name, ratio)
+    assert ratio < max_slowdown or np.median(t2 - t1) < min_slowdown, (
+        "%s slowed down by %0.2fx" % (name, ratio))
+
+
+class TestNeuronBenchmark(object):
+    dt = 0.001
+    n_neurons = np.array([100, 1000, 10000, 100000])
+    n_steps = np.array([10, 100])
+
+    neuron_types = [
+        ('LIF', nengo.LIF),
+        ('FastLIF', FastLIF),
+        ('IntegerLIF', IntegerLIF),
+        ('LIFRate', nengo.LIFRate),
+        ('SoftLIFRate', SoftLIFRate),
+        ('SoftLIFRate_lut', lambda: SoftLIFRate(lut_range=(-1, 10))),
+    ]
+    baselines = [
+        ('FastLIF', 'LIF'),
+        ('IntegerLIF', 'LIF'),
+        ('SoftLIFRate', 'LIFRate'),
+        ('SoftLIFRate_lut', 'LIFRate'),
+    ]
+
+    @staticmethod
+    def make_step(neuron_type, n, dt, rng):
+        J = rng.uniform(0, 10, size=n)
+        output = np.zeros(n)
+        if isinstance(neuron_type, IntegerLIF):
+            states = [np.zeros(n), np.zeros(n, dtype=np.int32)]
+        elif isinstance(neuron_type, nengo.LIF):
+            states = [np.zeros(n), np.zeros(n)]
+        else:
+            states = []
+
+        def step():
+            neuron_type.step_math(dt, J, output, *states)
+        return step
+
+    def time_neuron_type(self, neuron_type, rng):
+        times = np.zeros((len(self.n_neurons), len(self.n_steps)))
+        for i, n in enumerate(self.n_neurons):
+            step = self.make_step(neuron_type, n, self.dt, rng)
+            for j, n_steps in enumerate(self.n_steps):
+                def run():
+                    for _ in range(n_steps):
+                        step()
+                times[i, j] = time_call(run)
+        return times
+
+    @pytest.mark.slow
+    @pytest.mark.noassertions
+    def test_neuron_benchmark(self, rng, analytics, logger):
+        analytics.add_data('n_neurons', self.n_neurons, "Number of neurons")
+        analytics.add_data('n_steps', self.n_steps, "Number of steps")
+
+        times = {}
+        for name, neuron_type in self.neuron_types:
+            times[name] = self.time_neuron_type(neuron_type(), rng)
+            analytics.add_data(
+                name, times[name], "step_math time [s] (n_neurons x n_steps)")
+            logger.info("%s: %s", name, ", ".join(
+                "%d neurons: %0.3e s/step" % (n, t) for n, t in zip(
+                    self.n_neurons, times[name][:, -1] / self.n_steps[-1])))
+
+        for name, baseline in self.baselines:
+            logger.info("%s: %0.2fx the time of %s", name,
+                        np.median(times[name] / times[baseline]), baseline)
+
+    @pytest.mark.compare
+    def test_compare_neuron_benchmark(self, analytics_data, logger):
+        d1, d2 = analytics_data
+        assert np.all(d1['n_neurons'] == d2['n_neurons'])
+        assert np.all(d1['n_steps'] == d2['n_steps'])
+
+        for name, _ in self.neuron_types:
+            compare_times(name, d1[name], d2[name], logger)
+
+
+class TestRatesBenchmark(object):
+    dt = 0.001
+    n_neurons = np.array([10, 100, 1000])
+    durations = np.array([1., 10.])
+    rate = 20.  # average firing rate [Hz]
+
+    functions = [
+        ('rates_isi', rates_isi),
+        ('rates_kernel', rates_kernel),
+    ]
+
+    @pytest.mark.slow
+    @pytest.mark.noassertions
+    def test_rates_benchmark(self, rng, analytics, logger):
+        analytics.add_data('n_neurons', self.n_neurons, "Number of neurons")
+        analytics.add_data('durations', self.durations, "Duration [s]")
+
+        for name, function in self.functions:
+            times = np.zeros((len(self.n_neurons), len(self.durations)))
+            for i, n in enumerate(self.n_neurons):
+                for j, duration in enumerate(self.durations):
+                    t = self.dt * np.arange(1, int(duration / self.dt) + 1)
+                    spikes = (rng.uniform(size=(len(t), n))
+                              < self.rate * self.dt) / self.dt
+                    times[i, j] = time_call(
+                        lambda: function(t, spikes), repeat=3)
+
+            analytics.add_data(
+                name, times, "Time [s] (n_neurons x durations)")
+            logger.info("%s: %0.3e s for %d neurons, %0.1f s",
+                        name, times[-1, -1], self.n_neurons[-1],
+                        self.durations[-1])
+
+    @pytest.mark.compare
+    def test_compare_rates_benchmark(self, analytics_data, logger):
+        d1, d2 = analytics_data
+        assert np.all(d1['n_neurons'] == d2['n_neurons'])
+        assert np.all(d1['durations'] == d2['durations'])
+
+        for name, _ in self.functions:
+            compare_times(name, d1[name], d2[name], logger)
+
+
+class TestLoaderBenchmark(object):
+    """Time the dataset loaders on synthetic archives, so it runs offline"""
+
+    stages = ['hash', 'gunzip', 'unpickle', 'concatenate', 'decode',
+              'cache_save', 'cache_load']
+    modes = ['plain', 'cache_first', 'cache_second']
+
+    @staticmethod
+    def loaders(tmpdir, rng):
+        def path(name):
+            return os.path.join(tmpdir, name)
+
+        cifar10 = write_cifar10_tar_gz(
+            path('cifar10.tar.gz'), rng, n_per_batch=2000)
+        svhn = write_svhn_tar_gz(path('svhn.tar.gz'), rng, n_per_batch=2000)
+        mnist = write_mnist_pkl_gz(path('mnist.pkl.gz'), rng, n=10000)
+        ilsvrc = write_ilsvrc2012_tar_gz(
+            path('ilsvrc.tar.gz'), rng, n_batches=4, n_per_batch=100, size=64)
+        return [
+            ('cifar10', lambda **kw: load_cifar10(cifar10, **kw)),
+            ('svhn', lambda **kw: load_svhn(svhn, n_train=3, n_test=2, **kw)),
+            ('mnist', lambda **kw: load_mnist(mnist, **kw)),
+            ('ilsvrc2012', lambda **kw: load_ilsvrc2012(ilsvrc, **kw)),
+        ]
+
+    @pytest.mark.slow
+    @pytest.mark.noassertions
+    def test_loader_benchmark(self, tmpdir, monkeypatch, rng, analytics,
+                              logger):
+        tmpdir = str(tmpdir)
+        monkeypatch.setattr(nengo_extras.data, 'data_dir', tmpdir)
+
+        for name, loader in self.loaders(tmpdir, rng):
+            times = np.zeros((len(self.modes), len(self.stages) + 1))
+            for i, mode in enumerate(self.modes):
+                with load_stats() as stats:
+                    loader(cache=mode != 'plain')
+                logger.info("%s (%s):\n%s", name, mode, stats)
+
+                times[i, 0] = stats.wall_time
+                for j, stage in enumerate(self.stages):
+                    times[i, j+1] = stats.stages.get(stage, (0, 0., 0))[1]
+
+            analytics.add_data(name, times, "Time [s] (modes x (total, %s))"
+                               % ", ".join(self.stages))
+
+    @pytest.mark.compare
+    def test_compare_loader_benchmark(self, analytics_data, logger):
+        d1, d2 = analytics_data
+        for name in ('cifar10', 'svhn', 'mnist', 'ilsvrc2012'):
+            for i, mode in enumerate(self.modes):
+                compare_times("%s (%s)" % (name, mode),
+                              d1[name][i, 0], d2[name][i, 0], logger)
+
+            # loading from the cache must beat loading the archive
+            plain, cached = (d2[name][self.modes.index(mode), 0]
+                             for mode in ('plain', 'cache_second'))
+            assert cached < plain, "%s: cache is not faster" % name
+
+
+class TestConversionBenchmark(object):
+    """Time the NumPy layer implementations against Keras"""
+
+    data_formats = ['channels_first', 'channels_last']
+    n_examples = 500
+
+    @staticmethod
+    def kmodel(data_format):
+        import keras
+        kwargs = dict(data_format=data_format)
+        shape = (1, 28, 28) if data_format == 'channels_first' else (28, 28, 1)
+
+        kmodel = keras.models.Sequential()
+        kmodel.add(keras.layers.Conv2D(
+            16, (5, 5), strides=(2, 2), input_shape=shape, **kwargs))
+        kmodel.add(keras.layers.Activation('relu'))
+        kmodel.add(keras.layers.LocallyConnected2D(8, (3, 3), **kwargs))
+        kmodel.add(keras.layers.Activation('relu'))
+        kmodel.add(keras.layers.AveragePooling2D((2, 2), **kwargs))
+        kmodel.add(keras.layers.Flatten())
+        kmodel.add(keras.layers.Dense(10))
+        return kmodel
+
+    @pytest.mark.slow
+    @pytest.mark.noassertions
+    def test_conversion_benchmark(self, rng, analytics, logger):
+        pytest.importorskip('keras')
+        from nengo_extras.keras import SequentialNetwork, verify_conversion
+
+        for data_format in self.data_formats:
+            kmodel = self.kmodel(data_format)
+            net = SequentialNetwork(kmodel, synapse=None)
+            X = rng.uniform(
+                0, 1, size=(self.n_examples,) + kmodel.input_shape[1:])
+            report = verify_conversion(kmodel, net, X, batch_size=100)
+            logger.info("%s:\n%s", data_format, report)
+
+            times = [report.keras_time, report.network_time] + [
+                seconds for _, seconds in report.layers.values()]
+            analytics.add_data(
+                data_format, np.array(times),
+                "Time [s] (keras, network, %s)" % ", ".join(report.layers))
+
+    @pytest.mark.compare
+    def test_compare_conversion_benchmark(self, analytics_data, logger):
+        d1, d2 = analytics_data
+        for data_format in self.data_formats:
+            compare_times("%s network" % data_format,
+                          d1[data_format][1], d2[data_format][1], logger)
+
+
+class TestImportBenchmark(object):
+    """Time importing modules that have heavy optional dependencies"""
+
+    modules = ['nengo_extras.keras', 'nengo_extras.plot_spikes',
+               'nengo_extras.deepview', 'nengo_extras.deepnetworks']
+
+    @pytest.mark.slow
+    @pytest.mark.noassertions
+    def test_import_benchmark(self, analytics, logger):
+        times = np.zeros(len(self.modules))
+        for i, module in enumerate(self.modules):
+            times[i] = min(import_module(module)[0] for _ in range(5))
+            logger.info("%s: %0.3f s", module, times[i])
+
+        analytics.add_data('import', times, "Time [s] (%s)"
+                           % ", ".join(self.modules))
+
+    @pytest.mark.compare
+    def test_compare_import_benchmark(self, analytics_data, logger):
+        d1, d2 = analytics_data
+        for module, t1, t2 in zip(self.modules, d1['import'], d2['import']):
+            compare_times(module, t1, t2, logger)
+            assert t2 < import_budget, "%s: %0.3f s" % (module, t2)
@@ -5,6 +5,8 @@ import nengo
 from nengo.utils.stdlib import Timer
 
 from nengo_extras import Conv2d, Pool2d
+from nengo_extras.convnet import (
+    quantize_int8, quantized_buffer, quantized_dot)
 
 
 @pytest.mark.parametrize('local', [False, True])
@@ -93,3 +95,54 @@ def test_pool2d(s, st, Simulator, rng):
         sim.step()
     y = sim.data[vp][-1].reshape(result.shape)
     assert np.allclose(result, y, rtol=1e-3, atol=1e-6)
+
+
+def test_quantize_int8(rng):
+    magnitudes = np.array([1, 1e-3, 10, 0]).reshape(-1, 1, 1, 1)
+    filters = magnitudes * rng.uniform(-1, 1, size=(4, 3, 5, 5))
+    q, scales = quantize_int8(filters)
+    assert q.dtype == np.int8 and q.shape == filters.shape
+    assert np.all(np.abs(q).reshape(4, -1).max(axis=1) == [127, 127, 127, 0])
+    error = np.abs(scales[:, None, None, None] * q - filters)
+    assert np.all(error <= 0.5 * scales[:, None, None, None] + 1e-12)
+
+
+def test_quantized_dot(rng):
+    q, _ = quantize_int8(rng.uniform(-1, 1, size=(10, 7)))
+    x = rng.uniform(-1, 1, size=(3, 7))
+    buffer = quantized_buffer(q, max_size=20)  # two rows at a time
+    assert buffer.size == 20
+    y = quantized_dot(x, q, buffer=buffer)
+    assert y.dtype == np.float32
+    assert np.allclose(y, np.dot(x, q.T), rtol=1e-5)
+    assert np.allclose(quantized_dot(x[0], q), y[0])
+
+    q3 = q.reshape(5, 2, 7)[:, :, ::2]  # non-contiguous filters
+    x3 = rng.uniform(-1, 1, size=(3, 8))
+    y3 = quantized_dot(x3, q3, buffer=buffer)
+    assert np.allclose(y3, np.dot(x3, q3.reshape(5, -1).T), rtol=1e-5)
+
+
+@pytest.mark.parametrize('local', [False, True])
+def test_conv2d_scales(local, Simulator, rng):
+    c, ni, nj, f = 2, 6, 7, 3
+    fshape = (f, ni, nj, c, 3, 3) if local else (f, c, 3, 3)
+    filters, scales = quantize_int8(rng.uniform(-1, 1, size=fshape))
+    biases = rng.uniform(-1, 1, size=f)
+    image = rng.uniform(-1, 1, size=(c, ni, nj))
+
+    with nengo.Network() as model:
+        u = nengo.Node(image.ravel())
+        v = nengo.Node(Conv2d(
+            (c, ni, nj), filters, biases, padding=1, scales=scales))
+        scaled = scales.reshape((-1,) + (1,) * (len(fshape) - 1)) * filters
+        w = nengo.Node(Conv2d((c, ni, nj), scaled, biases, padding=1))
+        nengo.Connection(u, v, synapse=None)
+        nengo.Connection(u, w, synapse=None)
+        vp = nengo.Probe(v)
+        wp = nengo.Probe(w)
+
+    with Simulator(model) as sim:
+        sim.step()
+
+    assert np.allclose(sim.data[vp], sim.data[wp], rtol=1e-3, atol=1e-6)
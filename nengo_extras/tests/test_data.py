@@ -1,12 +1,93 @@
+import gzip
+import io
+import os
+import tarfile
+
+import nengo
+from nengo.utils.compat import pickle
 import numpy as np
 import pytest
 
+import nengo_extras.data
 from nengo_extras.data import (
-    load_cifar10, load_cifar100, load_ilsvrc2012, load_mnist, load_svhn,
-    one_hot_from_labels, spasafe_name, spasafe_names)
+    ArchiveDataset, ArrayDataset, iter_tarfile, load_cifar10, load_cifar100,
+    load_ilsvrc2012, load_mnist, load_stats, load_svhn, one_hot_from_labels,
+    PresentDataset, spasafe_name, spasafe_names, ZCAWhiten)
 from nengo_extras.matplotlib import tile
 
 
+def add_pickle(tar, name, obj):
+    b = pickle.dumps(obj, protocol=2)
+    info = tarfile.TarInfo(name)
+    info.size = len(b)
+    tar.addfile(info, io.BytesIO(b))
+
+
+def write_cifar10_tar_gz(filepath, rng, n_per_batch=20):
+    """Write a small archive with the layout of 'cifar-10-python.tar.gz'"""
+    batches = ['data_batch_%d' % (i+1) for i in range(5)] + ['test_batch']
+    with tarfile.open(filepath, 'w:gz') as tar:
+        for batch in batches:
+            add_pickle(tar, 'cifar-10-batches-py/%s' % batch, {
+                b'data': rng.randint(256, size=(n_per_batch, 3072)).astype(
+                    np.uint8),
+                b'labels': list(rng.randint(10, size=n_per_batch))})
+        add_pickle(tar, 'cifar-10-batches-py/batches.meta', {
+            b'label_names': [b'class%d' % i for i in range(10)]})
+    return filepath
+
+
+def write_svhn_tar_gz(filepath, rng, n_per_batch=20):
+    """Write a small archive with the layout of 'svhn-py-colmajor.tar.gz'"""
+    with tarfile.open(filepath, 'w:gz') as tar:
+        add_pickle(tar, 'svhn-py-colmajor/batches.meta', {
+            b'data_mean': rng.uniform(0, 255, size=(3072, 1)),
+            b'label_names': [b'%d' % i for i in range(10)]})
+        for i in [1, 2, 3, 10, 11]:
+            add_pickle(tar, 'svhn-py-colmajor/data_batch_%d' % i, {
+                b'data': rng.randint(256, size=(3072, n_per_batch)).astype(
+                    np.uint8),
+                b'labels': list(rng.randint(10, size=n_per_batch))})
+    return filepath
+
+
+def write_mnist_pkl_gz(filepath, rng, n=20):
+    """Write a small file with the layout of 'mnist.pkl.gz'"""
+    sets = tuple((rng.uniform(size=(n, 784)).astype(np.float32),
+                  rng.randint(10, size=n)) for _ in range(3))
+    with gzip.open(filepath, 'wb') as f:
+        pickle.dump(sets, f, protocol=2)
+    return filepath
+
+
+def write_ilsvrc2012_tar_gz(filepath, rng, n_batches=2, n_per_batch=5,
+                            size=16):
+    """Write a small archive with the layout of the ILSVRC 2012 batches"""
+    PIL_Image = pytest.importorskip('PIL.Image')
+
+    def jpeg(array):
+        f = io.BytesIO()
+        PIL_Image.fromarray(array).save(f, format='JPEG')
+        return f.getvalue()
+
+    with tarfile.open(filepath, 'w:gz') as tar:
+        for i in range(n_batches):
+            images = rng.randint(256, size=(n_per_batch, size, size, 3))
+            add_pickle(tar, 'ilsvrc-2012-batches/data_batch_%d.0' % i, {
+                b'data': [jpeg(x.astype(np.uint8)) for x in images],
+                b'labels': list(rng.randint(10, size=n_per_batch))})
+        add_pickle(tar, 'batches.meta', {
+            b'data_mean': rng.uniform(0, 255, size=3*size*size),
+            b'label_names': [b'class%d' % i for i in range(10)]})
+    return filepath
+
+
+@pytest.fixture
+def data_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(nengo_extras.data, 'data_dir', str(tmpdir))
+    return str(tmpdir)
+
+
 @pytest.mark.slow
 def test_load_cifar10(plt):
     (trainX, _), (_, _) = load_cifar10(n_train=1, n_test=0)
@@ -45,6 +126,164 @@ def test_load_svhn(plt):
     tile(trainX)
 
 
+def test_load_cached(data_dir, rng, monkeypatch):
+    filepath = write_cifar10_tar_gz(
+        os.path.join(data_dir, 'cifar10.tar.gz'), rng)
+
+    ref = load_cifar10(filepath, n_train=2, label_names=True)
+    cached0 = load_cifar10(filepath, n_train=2, label_names=True, cache=True)
+
+    # second load must come from the cache without opening the archive
+    def no_open(*args, **kwargs):
+        raise AssertionError("Archive should not be opened")
+    monkeypatch.setattr(nengo_extras.data.tarfile, 'open', no_open)
+    cached1 = load_cifar10(filepath, n_train=2, label_names=True, cache=True)
+
+    for cached in (cached0, cached1):
+        (trainX, trainY), (testX, testY), names = cached
+        assert isinstance(trainX, np.memmap)
+        assert not trainX.flags.writeable
+        assert np.array_equal(trainX, ref[0][0])
+        assert np.array_equal(trainY, ref[0][1])
+        assert np.array_equal(testX, ref[1][0])
+        assert np.array_equal(testY, ref[1][1])
+        assert names == ref[2]
+
+    # different arguments use a different cache entry
+    with pytest.raises(AssertionError):
+        load_cifar10(filepath, n_train=1, cache=True)
+
+    mnist_path = write_mnist_pkl_gz(
+        os.path.join(data_dir, 'mnist.pkl.gz'), rng)
+    ref = load_mnist(mnist_path, validation=True)
+    for _ in range(2):
+        cached = load_mnist(mnist_path, validation=True, cache=True)
+        for (x0, y0), (x1, y1) in zip(ref, cached):
+            assert np.array_equal(x0, x1) and np.array_equal(y0, y1)
+
+
+def test_load_ilsvrc2012_workers(data_dir, rng):
+    filepath = write_ilsvrc2012_tar_gz(
+        os.path.join(data_dir, 'ilsvrc.tar.gz'), rng)
+
+    images, labels, data_mean, names = load_ilsvrc2012(filepath)
+    assert images.shape == (10, 3, 16, 16)
+    assert labels.shape == (10,)
+    assert data_mean.shape == (3, 16, 16)
+    assert len(names) == 10
+
+    for workers in (2, 3):
+        images2, labels2, _, _ = load_ilsvrc2012(filepath, workers=workers)
+        assert type(images2) is np.ndarray
+        assert np.array_equal(images2, images)
+        assert np.array_equal(labels2, labels)
+
+    # the worker count is not part of the cache key
+    cached0 = load_ilsvrc2012(filepath, cache=True, workers=2)
+    cached1 = load_ilsvrc2012(filepath, cache=True)
+    assert np.array_equal(cached0[0], images)
+    assert cached0[0].filename == cached1[0].filename
+    assert len(os.listdir(nengo_extras.data.get_cache_dir())) == 2
+
+
+def test_load_lazy(data_dir, rng):
+    filepath = write_cifar10_tar_gz(
+        os.path.join(data_dir, 'cifar10.tar.gz'), rng)
+    (trainX, trainY), (testX, testY), names = load_cifar10(
+        filepath, n_train=3, label_names=True)
+
+    train, test, lazy_names = load_cifar10(
+        filepath, n_train=3, label_names=True, lazy=True)
+    assert isinstance(train, ArchiveDataset)
+    assert lazy_names == names
+
+    # only the batches needed for the indices are read
+    X, Y = train[5:25]
+    assert len(train._batches) == 2
+    assert np.array_equal(X, trainX[5:25]) and np.array_equal(Y, trainY[5:25])
+
+    x, y = train[-1]
+    assert np.array_equal(x, trainX[-1]) and y == trainY[-1]
+    assert len(train) == len(trainX)
+
+    inds = rng.permutation(len(train))[:17]
+    X, Y = train[inds]
+    assert np.array_equal(X, trainX[inds]) and np.array_equal(Y, trainY[inds])
+    with pytest.raises(IndexError):
+        train[len(train)]
+
+    batches = list(test.iter_batches(7))
+    assert [len(X) for X, _ in batches] == [7, 7, 6]
+    assert np.array_equal(np.vstack([X for X, _ in batches]), testX)
+
+    batches = list(train.iter_batches(8, shuffle=True, rng=rng))
+    Y = np.hstack([Y for _, Y in batches])
+    assert not np.array_equal(Y, trainY)
+    assert np.array_equal(np.sort(Y), np.sort(trainY))
+
+    train, test = load_cifar10(filepath, n_train=3, cache=True, lazy=True)
+    assert isinstance(train, ArrayDataset)
+    assert isinstance(train.X, np.memmap)
+    X, Y = train[inds]
+    assert np.array_equal(X, trainX[inds]) and np.array_equal(Y, trainY[inds])
+
+
+def test_iter_tarfile(tmpdir):
+    filepath = str(tmpdir.join('test.tar.gz'))
+    with tarfile.open(filepath, 'w:gz') as tar:
+        for i in range(5):
+            add_pickle(tar, 'dir/member%d' % i, i)
+
+    names = ['dir/member3', 'dir/member1']
+    assert [name for name, _ in iter_tarfile(filepath, names)] == [
+        'dir/member1', 'dir/member3']
+    assert [pickle.load(f) for _, f in iter_tarfile(
+        filepath, lambda name: name.endswith(('2', '4')))] == [2, 4]
+    with load_stats() as stats:
+        assert [pickle.load(f) for _, f in iter_tarfile(
+            filepath, names)] == [1, 3]
+    assert stats.stages['gunzip'][0] == 2 and stats.stages['gunzip'][2] > 0
+    with pytest.raises(KeyError):
+        list(iter_tarfile(filepath, ['dir/member5']))
+
+
+def test_load_single_pass(data_dir, rng, monkeypatch):
+    """Loaders read archives sequentially, without looking up members"""
+    cifar_path = write_cifar10_tar_gz(
+        os.path.join(data_dir, 'cifar10.tar.gz'), rng)
+    svhn_path = write_svhn_tar_gz(os.path.join(data_dir, 'svhn.tar.gz'), rng)
+    ilsvrc_path = write_ilsvrc2012_tar_gz(
+        os.path.join(data_dir, 'ilsvrc.tar.gz'), rng, n_batches=3)
+
+    def no_lookup(*args, **kwargs):
+        raise AssertionError("Members should not be looked up by name")
+    monkeypatch.setattr(tarfile.TarFile, 'getmembers', no_lookup)
+    monkeypatch.setattr(tarfile.TarFile, 'getnames', no_lookup)
+
+    (trainX, _), (testX, _), names = load_cifar10(
+        cifar_path, n_train=2, label_names=True)
+    assert trainX.shape == (40, 3072) and testX.shape == (20, 3072)
+    assert len(names) == 10
+
+    (trainX, trainY), (testX, testY), data_mean, names = load_svhn(
+        svhn_path, n_train=3, n_test=2, data_mean=True, label_names=True)
+    assert trainX.shape == (60, 3, 32, 32) and trainY.shape == (60,)
+    assert testX.shape == (40, 3, 32, 32) and testY.shape == (40,)
+    assert data_mean.shape == (3, 32, 32) and len(names) == 10
+
+    train, test, data_mean2, _ = load_svhn(
+        svhn_path, n_train=3, n_test=2, data_mean=True, label_names=True,
+        lazy=True)
+    assert np.array_equal(train[:][0], trainX)
+    assert np.array_equal(test[:][1], testY)
+    assert np.array_equal(data_mean2, data_mean)
+
+    images, labels, _, _ = load_ilsvrc2012(ilsvrc_path)
+    images1, labels1, _, _ = load_ilsvrc2012(ilsvrc_path, n_files=2)
+    assert np.array_equal(images1, images[:10])
+    assert np.array_equal(labels1, labels[:10])
+
+
 def test_one_hot_from_labels_int(rng):
     nc = 19
     labels = rng.randint(nc, size=1000)
@@ -80,6 +319,55 @@ def test_one_hot_from_labels_float(rng):
     assert np.array_equal(y, yref)
 
 
+def test_one_hot_from_labels_float_classes(rng):
+    labels = rng.uniform(0, 9, size=100)
+    y = one_hot_from_labels(labels)
+    assert np.array_equal(y.sum(axis=0), np.ones(100))
+    assert np.array_equal(np.sort(labels)[y.argmax(axis=1)], labels)
+
+    with pytest.raises(AssertionError):
+        one_hot_from_labels(labels, classes=labels[1:])
+    with pytest.raises(AssertionError):
+        one_hot_from_labels(labels, classes=labels[labels < labels.max()])
+
+
+def test_one_hot_from_labels_compact(rng):
+    pytest.importorskip('scipy.sparse')
+
+    labels = rng.randint(10, size=1000)
+    yref = one_hot_from_labels(labels)
+
+    y = one_hot_from_labels(labels, dtype=np.uint8)
+    assert y.dtype == np.uint8
+    assert np.array_equal(y, yref)
+
+    y = one_hot_from_labels(labels, classes=12, dtype=np.uint8, sparse=True)
+    assert y.shape == (1000, 12) and y.nnz == 1000 and y.dtype == np.uint8
+    assert np.array_equal(y.toarray()[:, :10], yref)
+
+    classes = rng.permutation(20) / 2.
+    y = one_hot_from_labels(classes[labels], classes=classes, sparse=True)
+    assert np.array_equal(y.toarray()[:, :10], yref)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_one_hot_from_labels_empty(sparse):
+    if sparse:
+        pytest.importorskip('scipy.sparse')
+
+    for labels, classes, n_classes in [
+            (np.zeros(0, dtype=int), None, 0),
+            (np.zeros(0, dtype=int), 5, 5),
+            (np.zeros(0), None, 0),
+            (np.zeros(0), [0.5, 1.5], 2),
+            (np.zeros(0), [], 0)]:
+        y = one_hot_from_labels(labels, classes=classes, sparse=sparse)
+        assert y.shape == (0, n_classes)
+
+    with pytest.raises(AssertionError):
+        one_hot_from_labels(np.ones(3), classes=[], sparse=sparse)
+
+
 def test_spasafe_name():
     assert spasafe_name('UPPER') == 'UPPER'
     assert spasafe_name('Camel') == 'Camel'
@@ -99,3 +387,163 @@ def test_spasafe_name():
 
 def test_spasafe_names():
     assert spasafe_names(['A,B', 'A', 'c\'s']) == ['A0', 'A1', 'Cs']
+
+
+def test_zca_partial_fit(rng):
+    A = rng.normal(size=(20, 20))
+    X = np.dot(rng.normal(size=(500, 20)), A) + rng.uniform(size=20)
+
+    zca = ZCAWhiten()
+    Y = zca.fit(X)
+    cov = np.dot(Y.T, Y) / (len(Y) - 1)
+    assert np.allclose(Y.mean(axis=0), 0, atol=1e-8)
+    # whitening maps the covariance C of the normalized data to Sinv C Sinv
+    # (not the identity, since `gamma` shrinks the low-variance directions)
+    C = np.cov(zca.contrast_normalize(X), rowvar=False)
+    assert np.allclose(cov, np.dot(np.dot(zca.Sinv, C), zca.Sinv))
+
+    zca2 = ZCAWhiten()
+    for i in range(0, len(X), 37):
+        zca2.partial_fit(X[i:i+37])
+    zca2.finalize()
+    assert zca2.n_samples == len(X)
+    assert np.allclose(zca2.pixel_mu, zca.pixel_mu)
+    assert np.allclose(zca2.Sinv, zca.Sinv)
+    assert np.allclose(zca2.transform(X, dtype=np.float64), Y)
+
+    with pytest.raises(ValueError):
+        zca2.partial_fit(X[:, :10])
+
+
+def test_zca_transform(rng):
+    A = rng.normal(size=(30, 30))
+    X = np.dot(rng.normal(size=(200, 30)), A)
+
+    zca = ZCAWhiten()
+    ref = zca.fit(X)
+    assert ref.dtype == np.float64
+
+    Y = zca.transform(X)
+    assert Y.dtype == np.float32
+    assert np.allclose(Y, ref, rtol=1e-3, atol=1e-3)
+
+    for batch_size in (1, 7, 200, 500):
+        Y = zca.transform(X, batch_size=batch_size, dtype=np.float64)
+        assert np.allclose(Y, ref)
+
+    out = np.zeros((200, 30), dtype=np.float32)
+    assert zca.transform(X, out=out, batch_size=16) is out
+    assert np.allclose(out, ref, rtol=1e-3, atol=1e-3)
+
+    out = np.zeros((30, 200))
+    zca.transform(X, out=out.T, batch_size=16)  # non-contiguous output
+    assert np.allclose(out.T, ref)
+
+    with pytest.raises(ValueError):
+        zca.transform(X, out=np.zeros((199, 30)))
+
+
+def test_zca_lowrank(rng):
+    d, k = 200, 10
+    A = rng.normal(size=(k, d))
+    X = np.dot(rng.normal(size=(1000, k)), A)
+    X += 0.1 * rng.normal(size=X.shape)
+
+    zca = ZCAWhiten()
+    zca.fit(X)
+    zca_k = ZCAWhiten(n_components=k, rng=np.random.RandomState(0))
+    Y = zca_k.fit(X)
+    assert zca_k.Sinv is None
+    assert zca_k.V.shape == (d, k)
+
+    # top eigenvalues match the exact decomposition
+    assert np.allclose(zca_k.e, zca.e[::-1][:k], rtol=1e-2)
+
+    # the remainder is the variance not captured by the top components
+    e_rest = zca.e[:-k].mean()
+    assert abs(zca_k.e_rest - e_rest) < 1e-3 * zca.e[-k:].sum() / (d - k)
+
+    # whitened data has unit variance along the top components
+    Vk = zca.V[:, -k:]
+    cov = np.dot(np.dot(Y, Vk).T, np.dot(Y, Vk)) / (len(Y) - 1)
+    assert np.allclose(cov, np.eye(k), atol=2e-2)
+
+    # streaming gives the same result
+    zca_k2 = ZCAWhiten(n_components=k, rng=np.random.RandomState(0))
+    for i in range(0, len(X), 300):
+        zca_k2.partial_fit(X[i:i+300])
+    zca_k2.finalize()
+    assert zca_k2.e_rest > zca_k.e_rest  # the sketch underestimates `e`
+    zca_k2.refine(X[i:i+300] for i in range(0, len(X), 300))
+    assert np.allclose(zca_k2.e, zca_k.e)
+    Y2 = zca_k2.transform(X, batch_size=128, dtype=np.float64)
+    assert np.allclose(Y2, Y)
+
+    with pytest.raises(ValueError):
+        zca_k2.refine(X[:100])
+
+    # fitting a list refines with the whole list, not row by row
+    zca_k3 = ZCAWhiten(n_components=k, rng=np.random.RandomState(0))
+    Y3 = zca_k3.fit(X.tolist())
+    assert np.allclose(zca_k3.e, zca_k.e)
+    assert np.allclose(Y3, Y)
+    zca_k3.refine([X[:500], X[500:]])
+    assert np.allclose(zca_k3.e, zca_k.e)
+
+
+def test_present_dataset(Simulator, data_dir, rng):
+    filepath = write_cifar10_tar_gz(
+        os.path.join(data_dir, 'cifar10.tar.gz'), rng, n_per_batch=7)
+    (X, _), _ = load_cifar10(filepath, n_train=2)
+    train, _ = load_cifar10(filepath, n_train=2, lazy=True)
+    data_mean = X.mean(axis=0)
+    zca = ZCAWhiten(n_components=5, rng=rng)
+    zca.fit(X)
+
+    pt = 0.003
+    with nengo.Network() as net:
+        u0 = nengo.Node(nengo.processes.PresentInput(X, pt))
+        u1 = nengo.Node(PresentDataset(train, pt, batch_size=3))
+        u2 = nengo.Node(PresentDataset(
+            X, pt, batch_size=5, prefetch=1, data_mean=data_mean))
+        u3 = nengo.Node(PresentDataset(train, pt, whiten=zca))
+        probes = [nengo.Probe(u) for u in (u0, u1, u2, u3)]
+
+    with Simulator(net) as sim:
+        sim.run(2.5 * len(X) * pt)  # cycles through the dataset
+
+    y0, y1, y2, y3 = [sim.data[p] for p in probes]
+    k = ((sim.trange() - sim.dt) / pt + 1e-7).astype(int) % len(X)
+    assert np.array_equal(y0, X[k])
+    assert np.array_equal(y1, y0)
+    assert np.allclose(y2, y0 - data_mean)
+    assert np.allclose(y3, zca.transform(X, dtype=np.float64)[k])
+
+    with pytest.raises(ValueError):
+        PresentDataset(np.zeros((0, 3)), pt)
+
+
+def test_load_stats(data_dir, rng):
+    filepath = write_cifar10_tar_gz(
+        os.path.join(data_dir, 'cifar10.tar.gz'), rng)
+
+    events = []
+    with load_stats(callback=lambda *args: events.append(args)) as stats:
+        load_cifar10(filepath, n_train=2, cache=True)
+    assert list(stats.stages) == [
+        'hash', 'gunzip', 'unpickle', 'concatenate', 'cache_save',
+        'cache_load']
+    assert len(events) == sum(calls for calls, _, _ in stats.stages.values())
+    assert stats.stages['gunzip'][0] == 3
+    assert stats.stages['gunzip'][2] > 3 * 20 * 3072
+    assert stats.wall_time >= sum(
+        stats.stages[stage][1] for stage in ('hash', 'gunzip', 'cache_save'))
+    assert 'concatenate' in str(stats)
+
+    with load_stats() as stats:
+        load_cifar10(filepath, n_train=2, cache=True)
+    assert sorted(stats.stages) == ['cache_load', 'unpickle']
+
+    # nothing is collected outside the block
+    load_cifar10(filepath, n_train=2)
+    assert sorted(stats.stages) == ['cache_load', 'unpickle']
@@ -1,8 +1,13 @@
+import nengo
 import numpy as np
 import pytest
 
 
-from nengo_extras.deepnetworks import ConvLayer, LocalLayer, NeuronLayer
+from nengo_extras.deepnetworks import (
+    ConvLayer, LocalLayer, NeuronLayer, NodeLayer, SequentialNetwork,
+    TreeNetwork, compare_quantized, layer_synapse, rate_response,
+    synapse_sweep)
+from nengo_extras.neurons import SoftLIFRate
 
 
 @pytest.mark.parametrize('local', (False, True))
@@ -70,3 +75,204 @@ def test_neuronlayer_softlif_theano():
 
     assert y0.shape == y1.shape
     assert np.allclose(y0, y1, atol=1e-7)
+
+
+def test_treenetwork(Simulator, rng):
+    x = rng.uniform(-1, 1, size=(3, 4))
+    w1 = rng.uniform(-1, 1, size=(5, 4))
+    w2 = rng.uniform(-1, 1, size=(5, 4))
+    bias = rng.uniform(-1, 1, size=5)
+
+    with nengo.Network() as model:
+        net = TreeNetwork()
+        data = net.add_named_input('data', 4)
+        a = net.add_full_layer(w1, bias, inputs=[data], name='a')
+        b = net.add_full_layer(w2, bias, inputs=[data], name='b')
+        s = net.add_sum_layer(5, inputs=[a, b], name='sum')
+        c = net.add_concat_layer([5, 4], inputs=[s, data], name='concat')
+        net.add_named_output('concat', c)
+
+        u = nengo.Node(nengo.processes.PresentInput(x, 0.001))
+        nengo.Connection(u, net.input, synapse=None)
+        p = nengo.Probe(net.output)
+
+    # the input layer is connected once to each layer using it
+    assert net.layer_inputs[c] == (s, data)
+    assert len([conn for conn in net.all_connections
+                if conn.pre_obj is data.output]) == 3
+
+    y = net.compute(x)
+    assert np.allclose(y[:, :5], x.dot(w1.T) + x.dot(w2.T) + 2 * bias)
+    assert np.allclose(y[:, 5:], x)
+    assert np.allclose(net.compute({'data': x}, output_layer='a'),
+                       x.dot(w1.T) + bias)
+
+    with Simulator(model) as sim:
+        sim.run_steps(len(x))
+    assert np.allclose(sim.data[p], y)
+
+
+def test_layer_synapse():
+    alpha = nengo.synapses.Alpha(0.01)
+    assert layer_synapse(alpha, 'a', 0) is alpha
+    assert layer_synapse(None, 'a', 3) is None
+    assert layer_synapse([0.001, 0.002], 'b', 1) == 0.002
+    assert layer_synapse(lambda name, depth: depth, 'a', 2) == 2
+
+    by_layer = {'a': 0.001, 1: 0.002, None: 0.003}
+    assert layer_synapse(by_layer, 'a', 1) == 0.001
+    assert layer_synapse(by_layer, 'b', 1) == 0.002
+    assert layer_synapse(by_layer, 'b', 2) == 0.003
+    assert layer_synapse({'a': 0.001}, 'b', 0) is None
+
+
+def test_synapse_sweep(Simulator, rng):
+    n, dt, presentation_time = 5, 0.001, 0.05
+    x = rng.uniform(-1, 1, size=(n, 4))
+    w1 = rng.uniform(-1, 1, size=(8, 4))
+    w2 = rng.uniform(-1, 1, size=(3, 8))
+    synapse = {'relu1': 0.002, 1: 0.005}
+
+    with nengo.Network() as model:
+        net = SequentialNetwork()
+        net.add_data_layer(4)
+        for i, w in enumerate((w1, w2)):
+            net.add_full_layer(w, rng.uniform(1, 2, size=len(w)))
+            name = 'relu%d' % (i + 1)
+            net.add_neuron_layer(
+                len(w), neuron_type=nengo.RectifiedLinear(), name=name,
+                synapse=layer_synapse(synapse, name, i))
+
+        u = nengo.Node(nengo.processes.PresentInput(x, presentation_time))
+        nengo.Connection(u, net.input, synapse=None)
+        p = nengo.Probe(net.output)
+
+    with Simulator(model, dt=dt) as sim:
+        sim.run(n * presentation_time)
+
+    # after the first presentation, the approximation matches a rate network
+    y = rate_response(net, x, synapse, presentation_time, dt=dt)
+    ysim = sim.data[p].reshape(n, -1, 3).transpose(1, 0, 2)
+    assert np.allclose(y[:, 1:], ysim[:, 1:], atol=0.05 * np.abs(y).max())
+
+    labels = np.argmax(net.compute(x), axis=1)
+    sweep = synapse_sweep(
+        net, {'none': None, 'short': 0.001, 'long': synapse, 'slow': 0.1},
+        x, labels, presentation_time, dt=dt)
+    assert np.allclose(sweep.t[[0, -1]], [dt, presentation_time])
+    assert np.all(sweep.accuracy['none'] == 1)
+    latency = sweep.latency(1.)
+    assert latency['none'] == dt
+    assert latency['none'] <= latency['short'] <= latency['long']
+    assert latency['long'] < presentation_time
+    assert 'short' in str(sweep)
+
+
+def test_save_load(Simulator, rng, tmpdir):
+    nc, nxi, nxj = 2, 6, 6
+    conv_filters = rng.uniform(-1, 1, size=(3, nc, 3, 3))
+    local_filters = rng.uniform(-1, 1, size=(2, 2, 2, 3, 3, 3))
+    weights = rng.uniform(-0.1, 0.1, size=(4, 8))
+
+    net = SequentialNetwork(label='net')
+    net.add_data_layer(nc * nxi * nxj, name='data')
+    net.add_conv_layer((nc, nxi, nxj), conv_filters,
+                       rng.uniform(-1, 1, size=3), padding=1, name='conv')
+    net.add_neuron_layer(3 * nxi * nxj, name='lif',
+                         neuron_type=SoftLIFRate(sigma=0.02, amplitude=0.01),
+                         synapse=nengo.Alpha(0.005), gain=2.,
+                         bias=rng.uniform(0, 1, size=3 * nxi * nxj))
+    net.add_pool_layer((3, nxi, nxj), 2, kind='max', name='pool')
+    net.add_local_layer((3, 3, 3), local_filters, rng.uniform(size=2),
+                        strides=2, padding=1, border='floor', name='local')
+    net.add_dropout_layer(8, 0.5)
+    net.add_full_layer(weights, rng.uniform(-1, 1, size=4), name='full')
+    net.add_neuron_layer(4, neuron_type=nengo.RectifiedLinear(),
+                         synapse=None, amplitude=3.)
+    net.add_softmax_layer(4, name='softmax')
+
+    path = str(tmpdir.join('net.npz'))
+    net.save(path)
+    with nengo.Network() as model:
+        net2 = SequentialNetwork.load(path, label='loaded')
+
+    assert net2.label == 'loaded'
+    assert [type(layer) for layer in net2.layers] == [
+        type(layer) for layer in net.layers]
+    assert sorted(net2.layers_by_name) == sorted(net.layers_by_name)
+    lif = net2.layers_by_name['lif']
+    assert lif.label == 'lif'
+    assert lif.neuron_type.sigma == 0.02
+    assert lif.synapse == nengo.Alpha(0.005)
+    assert net2.layers[-2].synapse is None
+
+    x = rng.uniform(-1, 1, size=(3, nc * nxi * nxj))
+    y = net.compute(x)
+    assert np.array_equal(net2.compute(x), y)
+
+    with model:
+        u = nengo.Node(nengo.processes.PresentInput(x, 0.001))
+        nengo.Connection(u, net2.input, synapse=None)
+        p = nengo.Probe(net2.layers_by_name['conv'].output)
+
+    with Simulator(model) as sim:
+        sim.run_steps(1)
+    assert np.allclose(sim.data[p][0], net.compute(
+        x[:1], output_layer=net.layers_by_name['conv'])[0])
+
+
+def test_save_unsupported(tmpdir):
+    net = SequentialNetwork()
+    net.add_data_layer(2)
+    net.add_layer(NodeLayer(size_in=2))
+    with pytest.raises(NotImplementedError):
+        net.save(str(tmpdir.join('net.npz')))
+
+
+def test_quantized_layers(Simulator, rng, tmpdir):
+    filters = rng.uniform(-1, 1, size=(4, 2, 3, 3))
+    weights = rng.uniform(-0.2, 0.2, size=(10, 4 * 5 * 5))
+    conv_biases = rng.uniform(size=4)
+    full_biases = rng.uniform(size=10)
+
+    def network(quantize):
+        net = SequentialNetwork()
+        net.add_data_layer(2 * 5 * 5)
+        net.add_conv_layer((2, 5, 5), filters, conv_biases,
+                           padding=1, quantize=quantize, name='conv')
+        net.add_neuron_layer(4 * 5 * 5, neuron_type=nengo.RectifiedLinear(),
+                             synapse=None)
+        net.add_full_layer(weights, full_biases, quantize=quantize,
+                           name='full')
+        return net
+
+    x = rng.uniform(0, 1, size=(100, 2 * 5 * 5))
+    with nengo.Network() as model:
+        net = network(False)
+        qnet = network(True)
+        u = nengo.Node(x[0])
+        nengo.Connection(u, qnet.input, synapse=None)
+        p = nengo.Probe(qnet.output)
+
+    full = qnet.layers_by_name['full']
+    assert full.weights.dtype == np.int8
+    assert full.size_in == net.layers_by_name['full'].size_in == 100
+    assert qnet.layers_by_name['conv'].process.filters.dtype == np.int8
+
+    report = compare_quantized(net, qnet, x)
+    assert list(report.layers) == ['0', 'conv', '2', 'full']
+    assert report.max_rel_error < 0.02
+    assert report.agreement > 0.95
+    assert report.float_bytes > 7 * report.quantized_bytes
+    assert 'agreement' in str(report)
+
+    # the quantized layers are used when simulating
+    with Simulator(model) as sim:
+        sim.run_steps(3)
+    assert np.allclose(sim.data[p][-1], qnet.compute(x[:1])[0])
+
+    path = str(tmpdir.join('qnet.npz'))
+    qnet.save(path)
+    qnet2 = SequentialNetwork.load(path)
+    assert qnet2.layers_by_name['full'].weights.dtype == np.int8
+    assert np.array_equal(qnet2.compute(x), qnet.compute(x))
@@ -0,0 +1,68 @@
+import subprocess
+import sys
+
+from nengo.utils.compat import PY2
+import pytest
+
+# Extra time allowed to import each module, after `nengo_extras` itself
+import_budget = 0.3
+
+# Modules, a dependency they need to import at all, and the heavy optional
+# dependencies that they should only import when they are used
+lazy_imports = [
+    ('nengo_extras.keras', None, ['keras', 'tensorflow', 'theano']),
+    ('nengo_extras.plot_spikes', 'matplotlib', ['matplotlib.pyplot']),
+    ('nengo_extras.deepview', 'Tkinter' if PY2 else 'tkinter',
+     ['PIL.ImageTk']),
+    ('nengo_extras.deepnetworks', None, ['keras', 'theano']),
+]
+if sys.version_info >= (3, 7):  # older versions import it through `compat`
+    lazy_imports.append(('nengo_extras', None, ['tkinter', 'Tkinter']))
+
+import_script = """
+import sys
+import timeit
+import nengo_extras
+t0 = timeit.default_timer()
+import %s
+print(timeit.default_timer() - t0)
+print(' '.join(m for m in %r if m in sys.modules))
+"""
+
+
+def import_module(module, heavy=()):
+    """Import ``module`` in a fresh interpreter.
+
+    Returns the time taken in seconds (not counting ``nengo_extras``), and
+    the modules in ``heavy`` that were imported.
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-c', import_script % (module, list(heavy))])
+    lines = output.decode().strip().split('\n')
+    imported = lines[1].split() if len(lines) > 1 else []
+    return float(lines[0]), imported
+
+
+@pytest.mark.parametrize('module, requires, heavy', lazy_imports)
+def test_lazy_imports(module, requires, heavy):
+    if requires is not None:
+        pytest.importorskip(requires)
+
+    _, imported = import_module(module, heavy)
+    assert imported == []
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('module, requires, heavy', lazy_imports)
+def test_import_time(module, requires, heavy):
+    if requires is not None:
+        pytest.importorskip(requires)
+
+    t = min(import_module(module)[0] for _ in range(3))
+    assert t < import_budget
+
+
+def test_compat_tkinter():
+    tkinter = pytest.importorskip('Tkinter' if PY2 else 'tkinter')
+    from nengo_extras import compat
+    assert compat.tkinter is tkinter
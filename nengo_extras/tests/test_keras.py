@@ -84,3 +84,350 @@ def test_conv2d_layer(Simulator, seed, rng, plt):
     y0 = kmodel.predict(X)[0]
     y1 = sim.data[output_p][-1].reshape(output_shape)
     assert np.allclose(y1, y0, atol=1e-5, rtol=1e-5)
+
+
+@pytest.mark.parametrize('layer_type', ('dense', 'conv2d'))
+def test_batchnorm_folding(layer_type, seed, rng):
+    pytest.importorskip('keras')
+    import keras
+    import nengo_extras.keras as nekeras
+    np.random.seed(seed)  # for Keras weights
+
+    kmodel = keras.models.Sequential()
+    if layer_type == 'dense':
+        shape_in = (10,)
+        kmodel.add(keras.layers.Dense(8, input_shape=shape_in))
+        kmodel.add(keras.layers.BatchNormalization())
+    else:
+        shape_in = (2, 8, 8)
+        kmodel.add(keras.layers.Conv2D(
+            4, (3, 3), use_bias=False, input_shape=shape_in,
+            data_format='channels_first'))
+        kmodel.add(keras.layers.BatchNormalization(axis=1, center=False))
+    kmodel.add(keras.layers.Activation('relu'))
+
+    bn = kmodel.layers[1]
+    bn.set_weights([rng.uniform(0.5, 2, size=w.shape)
+                    for w in bn.get_weights()])
+
+    knet = nekeras.SequentialNetwork(kmodel, synapse=None)
+    assert len(knet.layers) == 3  # data, dense/conv, relu
+    assert bn.name not in knet.layers_by_name
+
+    X = rng.uniform(-1, 1, size=(5,) + shape_in)
+    y0 = kmodel.predict(X).reshape(len(X), -1)
+    y1 = knet.compute(X.reshape(len(X), -1))
+    assert np.allclose(y1, y0, atol=1e-5, rtol=1e-5)
+
+
+def test_batchnorm_unfoldable():
+    pytest.importorskip('keras')
+    import keras
+    import nengo_extras.keras as nekeras
+
+    kmodel = keras.models.Sequential()
+    kmodel.add(keras.layers.Dense(8, input_shape=(10,)))
+    kmodel.add(keras.layers.Activation('relu'))
+    kmodel.add(keras.layers.BatchNormalization())
+
+    with pytest.raises(NotImplementedError):
+        nekeras.SequentialNetwork(kmodel)
+
+    # a nonlinear layer cannot have a following normalization folded in
+    kmodel = keras.models.Sequential()
+    kmodel.add(keras.layers.Dense(8, activation='relu', input_shape=(10,)))
+    kmodel.add(keras.layers.BatchNormalization())
+
+    with pytest.raises(NotImplementedError):
+        nekeras.SequentialNetwork(kmodel)
+
+
+@pytest.mark.parametrize('data_format', ('channels_first', 'channels_last'))
+@pytest.mark.parametrize('flatten_format', ('channels_first', 'channels_last'))
+def test_data_format(data_format, flatten_format, seed, rng):
+    pytest.importorskip('keras')
+    import keras
+    import nengo_extras.keras as nekeras
+    np.random.seed(seed)  # for Keras weights
+
+    img_shape = (2, 12, 12) if data_format == 'channels_first' else (12, 12, 2)
+    assert nekeras.channels_first_shape(img_shape, data_format) == (2, 12, 12)
+    kwargs = dict(data_format=data_format)
+
+    kmodel = keras.models.Sequential()
+    kmodel.add(keras.layers.Conv2D(
+        4, (3, 3), padding='same', input_shape=img_shape, **kwargs))
+    kmodel.add(keras.layers.Activation('relu'))
+    kmodel.add(keras.layers.AveragePooling2D((2, 2), **kwargs))
+    kmodel.add(keras.layers.LocallyConnected2D(
+        3, (3, 3), strides=(2, 2), **kwargs))
+    kmodel.add(keras.layers.BatchNormalization(
+        axis=1 if data_format == 'channels_first' else -1))
+    kmodel.add(keras.layers.Flatten(data_format=flatten_format))
+    kmodel.add(keras.layers.Dense(5))
+
+    for layer in kmodel.layers[3:5]:  # random biases and normalization
+        layer.set_weights([rng.uniform(0.5, 2, size=w.shape)
+                           for w in layer.get_weights()])
+
+    knet = nekeras.SequentialNetwork(kmodel, synapse=None)
+    assert len(knet.layers) == 6
+    assert knet.input_channels_last == (data_format == 'channels_last')
+
+    X = rng.uniform(-1, 1, size=(4,) + img_shape)
+    x = knet.keras_to_network(X)
+    for klayer in kmodel.layers[:3]:  # later layers have folded weights
+        kpart = keras.models.Model(kmodel.input, klayer.output)
+        y0 = knet.keras_to_network(kpart.predict(X), name=klayer.name)
+        y1 = knet.compute(x, output_layer=knet.layers_by_name[klayer.name])
+        assert np.allclose(y1, y0, atol=1e-5, rtol=1e-5), klayer.name
+
+    assert np.allclose(knet.compute(x), kmodel.predict(X),
+                       atol=1e-5, rtol=1e-5)
+
+
+def test_verify_conversion(seed, rng):
+    pytest.importorskip('keras')
+    import keras
+    import nengo_extras.keras as nekeras
+    np.random.seed(seed)  # for Keras weights
+
+    kmodel = keras.models.Sequential()
+    kmodel.add(keras.layers.Conv2D(
+        3, (3, 3), input_shape=(8, 8, 2), data_format='channels_last'))
+    kmodel.add(keras.layers.BatchNormalization())
+    kmodel.add(keras.layers.Activation('relu'))
+    kmodel.add(keras.layers.Flatten())
+    kmodel.add(keras.layers.Dense(4))
+    knet = nekeras.SequentialNetwork(kmodel, synapse=None)
+
+    X = rng.uniform(-1, 1, size=(7, 8, 8, 2))
+    report = nekeras.verify_conversion(kmodel, knet, X, batch_size=3)
+    names = [kmodel.layers[i].name for i in (0, 2, 4)]
+    assert list(report.layers) == names
+    assert report.n_examples == len(X)
+    assert report.max_error < 1e-5
+    assert report.keras_time > 0 and report.network_time > 0
+    assert all(name in str(report) for name in names)
+
+    knet.layers_by_name[names[-1]].weights[0] += 0.1
+    report = nekeras.verify_conversion(kmodel, knet, X, batch_size=3)
+    assert report.layers[names[1]][0] < 1e-5
+    assert report.layers[names[2]][0] > 1e-2
+
+
+def test_lsuvinit(seed, rng, capsys):
+    pytest.importorskip('keras')
+    import keras
+    import nengo_extras.keras as nekeras
+    np.random.seed(seed)  # for Keras weights
+
+    kmodel = keras.models.Sequential()
+    kmodel.add(keras.layers.Conv2D(
+        4, (3, 3), input_shape=(2, 8, 8), data_format='channels_first',
+        kernel_initializer='ones'))
+    kmodel.add(keras.layers.Activation('relu'))
+    kmodel.add(keras.layers.Flatten())
+    kmodel.add(keras.layers.Dense(10, use_bias=False))
+    kmodel.add(keras.layers.Dense(5, bias_initializer='ones'))
+
+    X = rng.uniform(-1, 1, size=(200, 2, 8, 8))
+    report = nekeras.LSUVinit(kmodel, X, tol=0.05, n_samples=100, rng=rng)
+    assert list(report) == [kmodel.layers[i].name for i in (0, 3, 4)]
+    assert capsys.readouterr()[0] == ''
+
+    for name, (iterations, std) in report.items():
+        assert 1 <= iterations < 10
+        kpart = keras.models.Model(
+            kmodel.input, kmodel.get_layer(name).output)
+        assert np.allclose(kpart.predict(X).std(), 1, atol=0.1)
+
+    # without converging, the report gives the std after the last rescaling
+    with pytest.warns(UserWarning):
+        report = nekeras.LSUVinit(kmodel, 10 * X, t_max=1, n_samples=None)
+    for name, (iterations, std) in report.items():
+        assert iterations == 1
+        kpart = keras.models.Model(
+            kmodel.input, kmodel.get_layer(name).output)
+        assert np.allclose(kpart.predict(10 * X).std(), std, rtol=1e-4)
+
+
+def test_softlif_negative():
+    pytest.importorskip('keras')
+    import keras.models
+    import nengo_extras.keras
+    from keras import backend as K
+
+    params = dict(sigma=0.02, amplitude=0.063, tau_rc=0.05, tau_ref=0.001)
+
+    model = keras.models.Sequential()
+    model.add(nengo_extras.keras.SoftLIF(input_shape=(1,), **params))
+
+    x = model.layers[0].input
+    y = model.layers[0].output
+    f = K.function([x], [y] + K.gradients(K.sum(y), [x]))
+
+    x = -np.logspace(-1, 5, 101).reshape(-1, 1)
+    y, dy = f([x])
+    y0, dy0 = nengo_extras.SoftLIFRate(**params).rates_and_derivative(
+        x, 1., 1.)
+
+    assert np.isfinite(y).all() and np.isfinite(dy).all()
+    assert np.all(y >= 0) and np.all(dy >= 0)
+    assert np.all(np.diff(dy[:, 0]) <= 0)  # monotonic as x decreases
+
+    # NumPy softplus underflows to zero, so only compare where it does not
+    m = y0 > 0
+    assert m.sum() > 10
+    assert np.allclose(y[m], y0[m], rtol=1e-4)
+    assert np.allclose(dy[m], dy0[m], rtol=1e-4)
+
+
+@pytest.mark.parametrize('data_format', ('channels_first', 'channels_last'))
+def test_tree_network(data_format, Simulator, seed, rng):
+    pytest.importorskip('keras')
+    import keras
+    import keras.layers as kl
+    import nengo_extras.keras as nekeras
+    np.random.seed(seed)  # for Keras weights
+
+    kwargs = dict(padding='same', data_format=data_format)
+    axis = 1 if data_format == 'channels_first' else -1
+    shape = (2, 6, 6) if data_format == 'channels_first' else (6, 6, 2)
+
+    # residual block, with a skip path also drawing on the input
+    inp = kl.Input(shape=shape)
+    c1 = kl.Conv2D(3, (3, 3), **kwargs)(inp)
+    a1 = kl.Activation('relu')(c1)
+    c2 = kl.Conv2D(3, (3, 3), **kwargs)(a1)
+    bn = kl.BatchNormalization(axis=axis)(c2)
+    res = kl.Add()([bn, c1])
+    skip = kl.Conv2D(2, (1, 1), **kwargs)(inp)
+    cat = kl.Concatenate(axis=axis)([res, skip])
+    a2 = kl.Activation('relu')(cat)
+    out = kl.Dense(4)(kl.Flatten()(a2))
+    kmodel = keras.models.Model(inp, out)
+
+    bnlayer = kmodel.layers[4]
+    bnlayer.set_weights([rng.uniform(0.5, 2, size=w.shape)
+                         for w in bnlayer.get_weights()])
+
+    shapes = nekeras.kmodel_compute_shapes(kmodel, (None,) + shape)
+    assert shapes[-1] == (None, 4)
+    assert len(shapes) == len(kmodel.layers)
+
+    with nengo.Network() as model:
+        knet = nekeras.TreeNetwork(kmodel, synapse=None)
+        X = rng.uniform(-1, 1, size=(3,) + shape)
+        u = nengo.Node(nengo.processes.PresentInput(
+            knet.keras_to_network(X), 0.001))
+        nengo.Connection(u, knet.input, synapse=None)
+        p = nengo.Probe(knet.output)
+
+    # batch normalization folded, flatten skipped, everything else built once
+    assert len(knet.layers) == len(kmodel.layers) - 2
+    assert bnlayer.name not in knet.layers_by_name
+    data = knet.layers_by_name[inp._keras_history[0].name]
+    assert len([c for c in knet.all_connections
+                if c.pre_obj is data.output]) == 2
+
+    y0 = kmodel.predict(X)
+    y1 = knet.compute(knet.keras_to_network(X))
+    assert np.allclose(y1, y0, atol=1e-5, rtol=1e-5)
+
+    with Simulator(model) as sim:
+        sim.run_steps(len(X))
+    assert np.allclose(sim.data[p], y0, atol=1e-4, rtol=1e-4)
+
+
+def test_tree_network_unsupported():
+    pytest.importorskip('keras')
+    import keras
+    import keras.layers as kl
+    import nengo_extras.keras as nekeras
+
+    inp = kl.Input(shape=(2, 4, 4))
+    c1 = kl.Conv2D(3, (3, 3), data_format='channels_first')(inp)
+    c2 = kl.Conv2D(3, (3, 3), data_format='channels_first')(inp)
+    out = kl.Concatenate(axis=2)([c1, c2])
+
+    with pytest.raises(NotImplementedError):
+        nekeras.TreeNetwork(keras.models.Model(inp, out))
+
+
+def test_layer_synapses():
+    pytest.importorskip('keras')
+    import keras
+    import nengo_extras.keras as nekeras
+
+    kmodel = keras.models.Sequential()
+    kmodel.add(keras.layers.Dense(6, input_shape=(4,)))
+    kmodel.add(keras.layers.Activation('relu', name='relu_a'))
+    kmodel.add(keras.layers.Dense(6))
+    kmodel.add(keras.layers.Activation('relu', name='relu_b'))
+    kmodel.add(keras.layers.Dense(6))
+    kmodel.add(nekeras.SoftLIF(name='softlif_c'))
+
+    knet = nekeras.SequentialNetwork(
+        kmodel, synapse={'relu_b': 0.003, 0: 0.001, None: 0.005})
+    synapses = [knet.layers_by_name[name].synapse
+                for name in ('relu_a', 'relu_b', 'softlif_c')]
+    assert [s.tau for s in synapses] == [0.001, 0.003, 0.005]
+
+    knet = nekeras.SequentialNetwork(kmodel, synapse=[None, 0.002, 0.004])
+    assert knet.layers_by_name['relu_a'].synapse is None
+    assert knet.layers_by_name['softlif_c'].synapse.tau == 0.004
+
+
+def test_save_load(seed, rng, tmpdir):
+    pytest.importorskip('keras')
+    import keras
+    import nengo_extras.keras as nekeras
+    from nengo_extras.deepnetworks import SequentialNetwork
+
+    np.random.seed(seed)
+    kmodel = keras.models.Sequential()
+    kmodel.add(keras.layers.Conv2D(
+        4, (3, 3), input_shape=(1, 6, 6), data_format='channels_first'))
+    kmodel.add(nekeras.SoftLIF(sigma=0.01, amplitude=0.063, name='softlif'))
+    kmodel.add(keras.layers.AveragePooling2D(data_format='channels_first'))
+    kmodel.add(keras.layers.Flatten())
+    kmodel.add(keras.layers.Dense(5))
+    kmodel.add(keras.layers.Activation('softmax'))
+
+    knet = nekeras.SequentialNetwork(kmodel, synapse=0.003)
+    path = str(tmpdir.join('net.npz'))
+    knet.save(path)
+    net = SequentialNetwork.load(path)
+
+    assert type(net) is SequentialNetwork
+    assert net.layers_by_name['softlif'].neuron_type == (
+        knet.layers_by_name['softlif'].neuron_type)
+    x = rng.uniform(0, 1, size=(4, 36))
+    assert np.allclose(net.compute(x), knet.compute(x))
+
+
+def test_quantize(seed, rng):
+    pytest.importorskip('keras')
+    import keras
+    import nengo_extras.keras as nekeras
+    from nengo_extras.deepnetworks import compare_quantized
+
+    np.random.seed(seed)
+    kmodel = keras.models.Sequential()
+    kmodel.add(keras.layers.Conv2D(
+        4, (3, 3), input_shape=(6, 6, 1), name='conv'))
+    kmodel.add(keras.layers.Activation('relu'))
+    kmodel.add(keras.layers.Flatten())
+    kmodel.add(keras.layers.Dense(5, name='dense'))
+
+    knet = nekeras.SequentialNetwork(kmodel)
+    qnet = nekeras.SequentialNetwork(kmodel, quantize=['dense'])
+    assert qnet.layers_by_name['dense'].weights.dtype == np.int8
+    assert qnet.layers_by_name['conv'].process.scales is None
+
+    x = rng.uniform(0, 1, size=(50,) + kmodel.input_shape[1:])
+    report = compare_quantized(
+        knet, qnet, knet.keras_to_network(x).reshape(len(x), -1))
+    assert report.layers['conv'][0] == 0
+    assert report.layers['dense'][1] < 0.02
@@ -1,11 +1,13 @@
 import nengo
+from nengo.exceptions import ValidationError
 from nengo.utils.matplotlib import implot
 from nengo.utils.numpy import rms
 import numpy as np
 import pytest
 
-from nengo_extras import FastLIF, SoftLIFRate
-from nengo_extras.neurons import rates_isi, rates_kernel
+from nengo_extras import FastLIF, IntegerLIF, SoftLIFRate
+from nengo_extras.neurons import (
+    SpikeEvents, rates_isi, rates_kernel, spikes2events)
 
 
 def test_softlifrate_rates(plt):
@@ -51,6 +53,50 @@ def test_softlifrate_derivative(plt):
     assert np.allclose(dr, deltar, atol=1e-5, rtol=1e-2)
 
 
+def test_softlifrate_rates_and_derivative(rng):
+    neuron = SoftLIFRate(sigma=0.05, amplitude=0.6)
+    x = rng.uniform(-3, 3, size=(20, 30))
+    gain = rng.uniform(0.5, 2, size=30)
+    bias = rng.uniform(-1, 2, size=30)
+
+    r, d = neuron.rates_and_derivative(x, gain, bias)
+    assert np.allclose(r, neuron.rates(x, gain, bias))
+
+    dx = 1e-6
+    r0 = neuron.rates(x - dx, gain, bias)
+    r1 = neuron.rates(x + dx, gain, bias)
+    dnum = (r1 - r0) / (2 * dx)
+    assert np.allclose(d, dnum, atol=1e-4, rtol=1e-4)
+    assert np.array_equal(d, neuron.derivative(x, gain, bias))
+
+
+@pytest.mark.parametrize('sigma', (1., 0.02))
+def test_softlifrate_lut(sigma, plt):
+    lut_tol = 1e-3
+    neuron = SoftLIFRate(sigma=sigma)
+    lut_neuron = SoftLIFRate(sigma=sigma, lut_range=(-1, 5), lut_tol=lut_tol)
+
+    x = np.linspace(-3, 8, 10001)  # extends past the table on both sides
+    r = neuron.rates(x, 1., 0.)
+    lut_r = lut_neuron.rates(x, 1., 0.)
+
+    plt.plot(x, r)
+    plt.plot(x, lut_r, 'k--')
+
+    assert np.abs(lut_r - r).max() <= lut_tol
+    assert np.array_equal(lut_r[x >= 5], r[x >= 5])
+
+    # the table is rebuilt when a parameter changes (set directly, since
+    # neuron parameters are read-only in recent versions of Nengo)
+    neuron2 = SoftLIFRate(sigma=2 * sigma)
+    SoftLIFRate.sigma.data[lut_neuron] = 2 * sigma
+    assert np.abs(lut_neuron.rates(x, 1., 0.) - neuron2.rates(
+        x, 1., 0.)).max() <= lut_tol
+
+    with pytest.raises(ValidationError):
+        SoftLIFRate(lut_range=(1, 0))
+
+
 def test_fastlif(plt):
     """Test that the dynamic model approximately matches the rates."""
     # Based nengo.tests.test_neurons.test_lif
@@ -112,6 +158,88 @@ def test_fastlif(plt):
     assert (abs(actual_counts - expected_counts) < 1).all()
 
 
+@pytest.mark.parametrize('x', (-0.5, 0.3, 1.0))
+def test_integerlif_tuning(x, Simulator, plt):
+    """Test that tuning curves match those of LIF as accurately as LIF"""
+    dt = 1e-3
+    n = 2000
+    max_rates = np.linspace(10, 400, n)
+    intercepts = np.linspace(-0.99, 0.99, n)[::-1]
+
+    m = nengo.Network()
+    with m:
+        ins = nengo.Node(x)
+        ensembles = [nengo.Ensemble(n, dimensions=1,
+                                    neuron_type=neuron_type,
+                                    encoders=np.ones((n, 1)),
+                                    max_rates=max_rates,
+                                    intercepts=intercepts)
+                     for neuron_type in (nengo.LIF(), IntegerLIF())]
+        probes = []
+        for ens in ensembles:
+            nengo.Connection(
+                ins, ens.neurons, transform=np.ones((n, 1)), synapse=None)
+            probes.append(nengo.Probe(ens.neurons))
+        ref_probe = nengo.Probe(ensembles[1].neurons, 'refractory_steps')
+
+    t_final = 1.0
+    with Simulator(m, dt=dt) as sim:
+        sim.run(t_final)
+
+    lif_type = ensembles[0].neuron_type
+    math_rates = lif_type.rates(x, *lif_type.gain_bias(max_rates, intercepts))
+    lif_rates, ilif_rates = [
+        (sim.data[p] > 0).sum(0) / t_final for p in probes]
+
+    plt.plot(intercepts, math_rates, 'k')
+    plt.plot(intercepts, lif_rates, '--')
+    plt.plot(intercepts, ilif_rates, ':')
+
+    assert sim.data[ref_probe].dtype.kind == 'i'
+    assert sim.data[ref_probe].max() == int(np.ceil(lif_type.tau_ref / dt))
+    lif_error = np.abs(lif_rates - math_rates).max()
+    assert np.abs(ilif_rates - math_rates).max() <= lif_error + 1
+    assert np.allclose(ilif_rates, math_rates, atol=1, rtol=0.02)
+
+
+def test_spike_events(rng):
+    dt = 0.001
+    t = dt * np.arange(1, 1001)
+    spikes = (rng.uniform(size=(len(t), 7)) < 0.02) / dt
+    spikes[:, 3] = 0  # silent neuron
+
+    events = SpikeEvents.from_dense(t, spikes)
+    assert len(events) == 7
+    assert events.n_events == np.count_nonzero(spikes)
+    assert events.values.ndim == 0
+    assert np.array_equal(events.to_dense(), spikes)
+    assert np.allclose(events.sum(), spikes.sum(axis=0))
+    for i, st in enumerate(events):
+        assert np.array_equal(st, t[spikes[:, i] != 0])
+
+    old_events = spikes2events(t, spikes.T)
+    assert all(np.array_equal(a, b) for a, b in zip(events, old_events))
+
+    sel = [5, 0, 3]
+    assert np.array_equal(events[sel].to_dense(), spikes[:, sel])
+    assert np.array_equal(events[1:4].to_dense(), spikes[:, 1:4])
+
+    tmask = (t >= 0.2) & (t < 0.45)
+    window = events.window(0.2, 0.45)
+    assert np.array_equal(window.t, t[tmask])
+    assert np.array_equal(window.to_dense(), spikes[tmask])
+
+
+def test_spike_events_values(rng):
+    t = np.arange(100)
+    spikes = rng.randint(-2, 3, size=(100, 4)).astype(float)
+    events = SpikeEvents.from_dense(t, spikes)
+    assert events.values.shape == events.indices.shape
+    assert np.array_equal(events.to_dense(), spikes)
+    assert np.allclose(events.sum(), spikes.sum(axis=0))
+    assert np.array_equal(events[::-1].to_dense(), spikes[:, ::-1])
+
+
 def _test_rates(Simulator, rates, plt, seed):
     n = 100
     intercepts = np.linspace(-0.99, 0.99, n)
@@ -165,6 +293,17 @@ def test_rates_isi(Simulator, plt, seed):
     assert rel_rmse < 0.3
 
 
+def test_rates_isi_events(rng):
+    pytest.importorskip('scipy')
+    dt = 0.001
+    t = dt * np.arange(1, 1001)
+    spikes = (rng.uniform(size=(len(t), 10)) < 0.05) / dt
+
+    rates0 = rates_isi(t, spikes)
+    rates1 = rates_isi(t, SpikeEvents.from_dense(t, spikes))
+    assert np.array_equal(rates0, rates1)
+
+
 def test_rates_kernel(Simulator, plt, seed):
     rel_rmse = _test_rates(Simulator, rates_kernel, plt, seed)
     assert rel_rmse < 0.25
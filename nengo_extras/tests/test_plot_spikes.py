@@ -3,6 +3,7 @@ import nengo
 import numpy as np
 import pytest
 
+from nengo_extras.neurons import SpikeEvents
 from nengo_extras.plot_spikes import (
     cluster, merge, plot_spikes, sample_by_activity, sample_by_variance)
 
@@ -54,6 +55,18 @@ def test_merge():
     assert (spikes_merged == expected).all()
 
 
+def test_merge_events(rng):
+    dt = 0.001
+    t = np.arange(0., 1., dt) + dt
+    spikes = (rng.uniform(size=(len(t), 11)) < 0.05) / dt
+
+    for num in (3, 4, 11, 20):
+        _, merged = merge(t, spikes, num=num)
+        _, merged_events = merge(t, SpikeEvents.from_dense(t, spikes), num=num)
+        assert isinstance(merged_events, SpikeEvents)
+        assert np.allclose(merged_events.to_dense(), merged)
+
+
 def test_sample_by_variance():
     dt = 0.001
     t = np.arange(0., 1., dt) + dt
@@ -104,3 +117,18 @@ def test_sample_by_activity():
         t, spikes, num=2, blocksize=2)
     assert (t_sampled == t).all()
     assert (spikes_sampled == np.ones((len(t), 2)) / dt).all()
+
+
+def test_sample_by_activity_events(rng):
+    dt = 0.001
+    t = np.arange(0., 1., dt) + dt
+    spikes = (rng.uniform(size=(len(t), 12)) < rng.uniform(0, 0.1, size=12))
+    spikes = spikes / dt
+    events = SpikeEvents.from_dense(t, spikes)
+
+    for num, blocksize in [(3, None), (4, 6), (6, 4), (20, None)]:
+        _, sampled = sample_by_activity(t, spikes, num, blocksize=blocksize)
+        _, sampled_events = sample_by_activity(
+            t, events, num, blocksize=blocksize)
+        assert isinstance(sampled_events, SpikeEvents)
+        assert np.array_equal(sampled_events.to_dense(), sampled)